@@ -25,31 +25,52 @@ Versão completa final (multiusuário) — integra Trello <-> Telegram:
 Notes:
 - Substitua TELEGRAM_TOKEN por seu token real (apenas nessa linha).
 - Instalar dependências:
-    pip install python-telegram-bot==20.5 requests pdfplumber
+    pip install python-telegram-bot==20.5 httpx orjson pdfplumber
+    pip install "redis>=5"  # opcional: defina REDIS_URL para guardar o estado dos usuários no Redis
 """
 
 import os
-import json
+import time
+import asyncio
 import logging
 import unicodedata
 import shutil
-from typing import Dict, Any, List, Optional
+import tempfile
+import functools
+import hashlib
+import random
+import sqlite3
+import weakref
+from contextlib import closing
+from types import MappingProxyType
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional, Callable, Awaitable
 from datetime import datetime
-import requests
+import httpx
+import orjson
 import pdfplumber
 import re
 
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # Redis é opcional; sem ele o estado fica só em memória
+    aioredis = None
+
 from telegram import (
     Update,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
+    Message,
     File as TgFile,
 )
 from telegram.ext import (
     ApplicationBuilder,
+    BaseUpdateProcessor,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
+    TypeHandler,
     filters,
     ContextTypes,
 )
@@ -86,50 +107,291 @@ if not TELEGRAM_TOKEN:
 USERS_FILE = "usuarios.json"
 API_BASE = "https://api.trello.com/1"
 DOWNLOAD_DIR = "downloads"
-RASCUNHOS_DIR = "rascunhos_cartoes"
+RASCUNHOS_DB = "rascunhos.db"
+RASCUNHOS_DIR = "rascunhos_cartoes"  # formato antigo (um .json por rascunho), migrado ao carregar
 MAX_MSG_CHARS = 3800
 ITEMS_PER_PAGE = 15
+SHORT_LIMIT = 30  # tamanho dos nomes nos botões
+PREFETCH_CARDS = 3  # cartões da busca pré-carregados em segundo plano
+DETAIL_CACHE_TTL = 60  # segundos
+BOARD_CACHE_TTL = 90  # segundos (listas, etiquetas e membros do quadro)
+MAX_TRELLO_CONCURRENCY = 8  # requisições simultâneas ao Trello (todos os usuários)
+BATCH_MAX_ITEMS = 10  # limite de caminhos por /batch do Trello
+MAX_RETRIES_TRELLO = 5  # novas tentativas quando o Trello responde 429 (limite de taxa) ou 5xx
+TRELLO_RATE_LIMIT = 100  # requisições por token a cada TRELLO_RATE_INTERVAL (até o Trello informar outro valor)
+TRELLO_RATE_INTERVAL = 10.0  # segundos
+RETRY_LOG_INTERVAL = 5 * 60  # segundos entre os resumos de novas tentativas no log
+LISTA_NOVOS_PEDIDOS = "🚨 PEDIDOS SEM ARTE"  # onde o /criar coloca os cartões
+CRIAR_CONCORRENCIA = 8  # cartões criados ao mesmo tempo pelo /criar
+HTTP_MAX_CONNECTIONS = 64  # conexões do cliente HTTP compartilhado (todas podem ficar abertas em keep-alive)
+HTTP_KEEPALIVE_EXPIRY = 30  # segundos que uma conexão ociosa fica no pool
+PDF_WORKERS = os.cpu_count() or 1  # processos que extraem dados dos PDFs
+PDF_BATCH_WINDOW = 0.5  # segundos sem novos PDFs antes de processar o lote do usuário
+DOWNLOAD_CHUNK = 1 << 20  # bytes lidos por vez ao baixar arquivos do Telegram
+MAX_UPDATES_CONCORRENTES = 256  # updates tratados ao mesmo tempo (os de um mesmo usuário seguem em ordem)
+MAX_ANEXOS_PENDENTES = 50  # arquivos aguardando /ok por usuário
+SESSION_TTL = 30 * 60  # sessões sem uso por esse tempo (s) são descartadas da memória
+STATE_TTL = 24 * 3600  # validade (s) do estado guardado no Redis
+REDIS_URL = os.environ.get("REDIS_URL")
+CALLBACK_VERSION = "v1"  # prefixo do callback_data compacto (ver CALLBACK_ROUTES)
 
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
-os.makedirs(RASCUNHOS_DIR, exist_ok=True)
 
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
+# o httpx registra cada URL em INFO; o bot já loga o que interessa das requisições
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
 # Log para verificar se o bot iniciou
 logger.info("🤖 Bot iniciando...")
 logger.info(f"📁 Diretório atual: {os.getcwd()}")
 logger.info(f"📁 Conteúdo do diretório: {os.listdir('.')}")
 
-# in-memory per-user state
-user_states: Dict[int, Dict[str, Any]] = {}
+# cliente HTTP compartilhado (criado sob demanda / no post_init)
+_http_client: Optional[httpx.AsyncClient] = None
+_trello_semaphore = asyncio.Semaphore(MAX_TRELLO_CONCURRENCY)
+
+# novas tentativas (429/5xx) desde o último resumo no log
+_retries_trello = 0
+_retries_trello_desde = time.monotonic()
+
+# referências para tarefas em segundo plano (evita que sejam coletadas antes de terminar)
+_background_tasks: set = set()
 
 
 # -------------------- Helpers --------------------
 
 
+# usuarios.json já lido: (mtime_ns do arquivo, conteúdo); save_users atualiza junto com o arquivo
+_users_cache: Optional[tuple] = None
+
+
 def load_users() -> Dict[str, Dict[str, str]]:
-    if not os.path.exists(USERS_FILE):
+    """Credenciais de todos os usuários; só relê o arquivo se ele mudou desde a última leitura"""
+    global _users_cache
+    try:
+        mtime = os.stat(USERS_FILE).st_mtime_ns
+    except FileNotFoundError:
         return {}
+    if _users_cache is not None and _users_cache[0] == mtime:
+        return _users_cache[1]
     try:
-        with open(USERS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with open(USERS_FILE, "rb") as f:
+            users = orjson.loads(f.read())
     except Exception as e:
         logger.exception("Erro lendo usuarios.json: %s", e)
         return {}
+    _users_cache = (mtime, users)
+    return users
 
 
 def save_users(data: Dict[str, Dict[str, str]]):
+    global _users_cache
     try:
-        with open(USERS_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        with open(USERS_FILE, "wb") as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        _users_cache = (os.stat(USERS_FILE).st_mtime_ns, data)
     except Exception as e:
         logger.exception("Erro salvando usuarios.json: %s", e)
 
 
+def _spawn(coro) -> asyncio.Task:
+    """Agenda uma coroutine em segundo plano mantendo uma referência até terminar"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+def _caminho_anexo(user_id: int, file_name: str) -> str:
+    """Caminho novo em disco para um anexo recebido.
+
+    Cada anexo ganha um diretório temporário próprio dentro de DOWNLOAD_DIR, então
+    arquivos com o mesmo nome não se sobrescrevem e o nome original (usado no Trello)
+    é preservado.
+    """
+    pasta = tempfile.mkdtemp(prefix=f"anexo_{user_id}_", dir=DOWNLOAD_DIR)
+    return os.path.join(pasta, os.path.basename(file_name or "arquivo"))
+
+
+def _remover_arquivo(path: str):
+    """Apaga um arquivo temporário (e o diretório do anexo), ignorando se já não existe"""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Erro ao remover arquivo temporário {path}: {e}")
+        return
+
+    pasta = os.path.dirname(path)
+    if os.path.basename(pasta).startswith("anexo_"):
+        try:
+            os.rmdir(pasta)
+        except OSError:
+            pass
+
+
+class AnexosPendentes(deque):
+    """Fila limitada dos anexos baixados que aguardam /ok.
+
+    Ao passar do limite, o arquivo mais antigo sai da fila e é apagado do disco.
+    """
+
+    def __init__(self, iterable=(), maxlen: int = MAX_ANEXOS_PENDENTES):
+        super().__init__(iterable, maxlen)
+
+    def append(self, path: str):
+        if len(self) == self.maxlen:
+            _remover_arquivo(self[0])
+        super().append(path)
+
+    def descartar(self):
+        """Apaga todos os arquivos ainda pendentes"""
+        while self:
+            _remover_arquivo(self.popleft())
+
+
+def _descartar_anexos(state: Dict[str, Any]):
+    """Apaga os anexos pendentes de um estado (cancelamento, troca de modo, expiração)"""
+    anexos = state.get("anexos")
+    if isinstance(anexos, AnexosPendentes):
+        anexos.descartar()
+
+
+class SessionStates(dict):
+    """Estados por usuário que expiram após `ttl` segundos sem uso"""
+
+    def __init__(self, ttl: float):
+        super().__init__()
+        self.ttl = ttl
+        self._vistos: Dict[int, float] = {}
+
+    def _tocar(self, user_id: int):
+        self._vistos[user_id] = time.monotonic()
+
+    def __getitem__(self, user_id):
+        self._tocar(user_id)
+        return super().__getitem__(user_id)
+
+    def __setitem__(self, user_id, state):
+        self._tocar(user_id)
+        super().__setitem__(user_id, state)
+
+    def __delitem__(self, user_id):
+        self._vistos.pop(user_id, None)
+        super().__delitem__(user_id)
+
+    def get(self, user_id, default=None):
+        if user_id in self:
+            self._tocar(user_id)
+        return super().get(user_id, default)
+
+    def setdefault(self, user_id, default=None):
+        self._tocar(user_id)
+        return super().setdefault(user_id, default)
+
+    def expirar(self) -> List[tuple]:
+        """Remove e devolve (user_id, estado) dos estados sem uso há mais de `ttl` segundos"""
+        limite = time.monotonic() - self.ttl
+        vencidos = [uid for uid, visto in self._vistos.items() if visto < limite]
+        removidos = []
+        for uid in vencidos:
+            del self._vistos[uid]
+            state = super().pop(uid, None)
+            if state is not None:
+                removidos.append((uid, state))
+        return removidos
+
+
+class StateStore:
+    """Estado por usuário em duas camadas: memória do processo e, com REDIS_URL, o Redis.
+
+    Os handlers alteram o dict devolvido por get() no próprio lugar; persistir_estado
+    grava no Redis o estado de quem gerou cada update depois que os handlers terminam.
+    """
+
+    # chaves que só fazem sentido dentro deste processo
+    TRANSITORIAS = frozenset({"detail_cache"})
+
+    def __init__(self, local: SessionStates, redis_url: Optional[str] = None, ttl: int = STATE_TTL):
+        self.local = local
+        self._ttl = ttl
+        self._redis = None
+        if redis_url:
+            if aioredis is None:
+                logger.warning("REDIS_URL definido, mas o pacote redis não está instalado; estado ficará só em memória")
+            else:
+                self._redis = aioredis.from_url(redis_url)
+
+    @staticmethod
+    def _chave(user_id: int) -> str:
+        return f"state:{user_id}"
+
+    async def get(self, user_id: int) -> Dict[str, Any]:
+        """Estado do usuário (vazio se não houver); o dict devolvido é o próprio estado guardado"""
+        state = self.local.get(user_id)
+        if state is not None:
+            return state
+        state = {}
+        if self._redis is not None:
+            try:
+                raw = await self._redis.get(self._chave(user_id))
+            except Exception as e:
+                logger.warning(f"Erro lendo estado do usuário {user_id} no Redis: {e}")
+                raw = None
+            if raw:
+                state = orjson.loads(raw)
+                if "anexos" in state:
+                    state["anexos"] = AnexosPendentes(state["anexos"])
+        return self.local.setdefault(user_id, state)
+
+    async def set(self, user_id: int, state: Dict[str, Any]):
+        """Substitui o estado do usuário (gravado no Redis ao fim do update)"""
+        self.local[user_id] = state
+
+    async def salvar(self, user_id: int, state: Optional[Dict[str, Any]] = None):
+        """Grava no Redis o estado do usuário; sem Redis não faz nada"""
+        if self._redis is None:
+            return
+        if state is None:
+            state = self.local.get(user_id)
+            if state is None:
+                return
+        dados = {k: v for k, v in state.items() if k not in self.TRANSITORIAS}
+        try:
+            # default=list cobre a fila de anexos pendentes (deque)
+            await self._redis.set(self._chave(user_id), orjson.dumps(dados, default=list), ex=self._ttl)
+        except Exception as e:
+            logger.warning(f"Erro gravando estado do usuário {user_id} no Redis: {e}")
+
+    async def encerrar(self):
+        if self._redis is not None:
+            await self._redis.aclose()
+
+
+# in-memory per-user state (camada local do state_store)
+user_states: Dict[int, Dict[str, Any]] = SessionStates(SESSION_TTL)
+state_store = StateStore(user_states, REDIS_URL)
+
+
+async def _expirar_sessoes(intervalo: float = 60.0):
+    """Descarta periodicamente as sessões abandonadas e seus anexos pendentes"""
+    while True:
+        await asyncio.sleep(intervalo)
+        expirados = user_states.expirar()
+        for user_id, state in expirados:
+            _descartar_anexos(state)
+            # mantém a cópia do Redis coerente com os arquivos apagados
+            await state_store.salvar(user_id, state)
+        if expirados:
+            logger.info(f"{len(expirados)} sessão(ões) expirada(s) por inatividade")
+
+
+@functools.lru_cache(maxsize=4096)
 def normalize_text(s: Optional[str]) -> str:
     if not s:
         return ""
@@ -138,6 +400,14 @@ def normalize_text(s: Optional[str]) -> str:
     return only_ascii.lower().strip()
 
 
+def indexar_por_nome(itens: List[Dict[str, Any]], campo: str = "name") -> Dict[str, Dict[str, Any]]:
+    """{nome normalizado: item}; com nomes repetidos vale o primeiro, como numa busca em ordem"""
+    indice = {}
+    for item in itens:
+        indice.setdefault(normalize_text(item.get(campo)), item)
+    return indice
+
+
 def user_data_or_raise(user_id: int) -> Dict[str, str]:
     users = load_users()
     u = users.get(str(user_id))
@@ -146,15 +416,165 @@ def user_data_or_raise(user_id: int) -> Dict[str, str]:
     return u
 
 
-def trello_request_for_user(user_id: int, method: str, path: str, params=None, json_payload=None, files=None,
-                            timeout=30):
+def _auth_header(u: Dict[str, str]) -> Dict[str, str]:
+    """Credenciais do Trello no cabeçalho Authorization, fora da URL (que o httpx registra no log)"""
+    return {"Authorization": f'OAuth oauth_consumer_key="{u["api_key"]}", oauth_token="{u["token"]}"'}
+
+
+def http_client() -> httpx.AsyncClient:
+    """Cliente HTTP compartilhado (pool de conexões keep-alive) para o Trello e downloads do Telegram"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY),
+        )
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+async def baixar_arquivo(file, path: str, chunk: int = DOWNLOAD_CHUNK):
+    """Baixa um arquivo do Telegram direto para `path`, em partes de `chunk` bytes.
+
+    Usa o cliente HTTP compartilhado e grava cada parte fora do event loop. Se o
+    download falhar, o arquivo incompleto é apagado.
+    """
+    if not (file.file_path or "").startswith("http"):
+        # servidor local do Bot API: não há URL para baixar
+        await file.download_to_drive(path)
+        return
+    try:
+        async with http_client().stream("GET", file.file_path, timeout=120) as resp:
+            resp.raise_for_status()
+            with open(path, "wb") as f:
+                async for parte in resp.aiter_bytes(chunk):
+                    await asyncio.to_thread(f.write, parte)
+    except BaseException:
+        _remover_arquivo(path)
+        raise
+
+
+def _contar_retry():
+    """Conta uma nova tentativa (429/5xx) e registra o total a cada RETRY_LOG_INTERVAL"""
+    global _retries_trello, _retries_trello_desde
+    _retries_trello += 1
+    agora = time.monotonic()
+    if agora - _retries_trello_desde >= RETRY_LOG_INTERVAL:
+        logger.warning(f"Trello: {_retries_trello} novas tentativas (429/5xx) nos últimos "
+                       f"{int(agora - _retries_trello_desde)}s")
+        _retries_trello = 0
+        _retries_trello_desde = agora
+
+
+class TrelloRateLimiter:
+    """Balde de fichas de um token do Trello, acertado pelos cabeçalhos X-Rate-Limit-Api-Token-*.
+
+    Cada requisição gasta uma ficha; as fichas voltam continuamente no ritmo
+    permitido pelo Trello. Com o balde vazio, `acquire` espera a próxima ficha em
+    vez de deixar a requisição voltar com 429.
+    """
+
+    def __init__(self, limite: int = TRELLO_RATE_LIMIT, intervalo: float = TRELLO_RATE_INTERVAL):
+        self._capacidade = float(limite)
+        self._taxa = limite / intervalo  # fichas por segundo
+        self._fichas = float(limite)
+        self._atualizado = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _repor(self):
+        agora = time.monotonic()
+        self._fichas = min(self._capacidade, self._fichas + (agora - self._atualizado) * self._taxa)
+        self._atualizado = agora
+
+    async def acquire(self):
+        async with self._lock:
+            self._repor()
+            if self._fichas < 1:
+                await asyncio.sleep((1 - self._fichas) / self._taxa)
+                self._repor()
+            self._fichas -= 1
+
+    def atualizar(self, headers: httpx.Headers):
+        """Alinha o balde com o que o Trello diz que ainda resta"""
+        try:
+            restantes = float(headers["X-Rate-Limit-Api-Token-Remaining"])
+            maximo = float(headers.get("X-Rate-Limit-Api-Token-Max", self._capacidade))
+            intervalo_ms = float(headers.get("X-Rate-Limit-Api-Token-Interval-Ms", 0))
+        except (KeyError, ValueError):
+            return
+        if intervalo_ms > 0:
+            self._capacidade = maximo
+            self._taxa = maximo / (intervalo_ms / 1000)
+        self._repor()
+        self._fichas = min(self._fichas, restantes)
+
+
+# um limitador por (api_key, token): o limite do Trello é por token
+_rate_limiters: Dict[tuple, TrelloRateLimiter] = {}
+
+
+def _rate_limiter(u: Dict[str, str]) -> TrelloRateLimiter:
+    chave = (u["api_key"], u["token"])
+    limiter = _rate_limiters.get(chave)
+    if limiter is None:
+        limiter = _rate_limiters[chave] = TrelloRateLimiter()
+    return limiter
+
+
+# métodos que podem ser repetidos sem risco de duplicar o que já foi gravado
+METODOS_IDEMPOTENTES = frozenset({"GET", "PUT", "DELETE"})
+
+
+async def _enviar_ao_trello(enviar, limiter: TrelloRateLimiter, idempotente: bool) -> httpx.Response:
+    """Executa `enviar()` respeitando o limite do token e o semáforo do Trello.
+
+    Repete em caso de 429 (esperando o Retry-After, com um pouco de jitter), até
+    MAX_RETRIES_TRELLO vezes: o Trello não processou a requisição. Um 5xx só é
+    repetido (0.1 * 2**tentativa segundos) se `idempotente`, porque a escrita pode
+    ter sido gravada antes do erro e um novo POST criaria um cartão/comentário/anexo
+    duplicado. As esperas ficam fora do semáforo, para não segurar a vaga de outros
+    usuários.
+    """
+    for tentativa in range(MAX_RETRIES_TRELLO + 1):
+        await limiter.acquire()
+        async with _trello_semaphore:
+            resp = await enviar()
+        limiter.atualizar(resp.headers)
+        if tentativa == MAX_RETRIES_TRELLO:
+            return resp
+        if resp.status_code == 429:
+            try:
+                espera = float(resp.headers.get("Retry-After", "1"))
+            except ValueError:
+                espera = 1.0
+            espera += random.random() * 0.3
+        elif resp.status_code >= 500 and idempotente:
+            espera = 0.1 * 2 ** tentativa
+        else:
+            return resp
+        _contar_retry()
+        await asyncio.sleep(espera)
+    return resp
+
+
+async def trello_request_for_user(user_id: int, method: str, path: str, params=None, json_payload=None, files=None,
+                                  timeout=30):
     u = user_data_or_raise(user_id)
-    if params is None:
-        params = {}
-    params.update({"key": u["api_key"], "token": u["token"]})
     url = API_BASE + path
-    resp = requests.request(method, url, params=params, json=json_payload, files=files, timeout=timeout)
-    if not resp.ok:
+    headers = _auth_header(u)
+    resp = await _enviar_ao_trello(
+        lambda: http_client().request(method, url, params=params, json=json_payload, files=files,
+                                      headers=headers, timeout=timeout),
+        _rate_limiter(u),
+        idempotente=method.upper() in METODOS_IDEMPOTENTES,
+    )
+    if resp.is_error:
         logger.error("Trello API error %s %s -> %s", method, url, resp.status_code)
         logger.error(resp.text)
     resp.raise_for_status()
@@ -165,82 +585,281 @@ def trello_request_for_user(user_id: int, method: str, path: str, params=None, j
         return resp.text
 
 
+async def trello_batch(user_id: int, paths: List[str]) -> List[Any]:
+    """Faz até 10 GETs em uma única requisição (GET /batch).
+
+    Os caminhos não podem conter vírgulas. Devolve os corpos na mesma ordem;
+    se algum deles falhar, levanta ValueError.
+    """
+    respostas = await trello_request_for_user(user_id, "GET", "/batch", params={"urls": ",".join(paths)})
+    resultados = []
+    for path, resposta in zip(paths, respostas):
+        if "200" not in resposta:
+            raise ValueError(f"Erro no batch do Trello para {path}: {resposta}")
+        resultados.append(resposta["200"])
+    return resultados
+
+
+class TrelloBatcher:
+    """Junta em um único GET /batch os GETs de um usuário feitos ao mesmo tempo.
+
+    O envio é agendado para a próxima volta do event loop: um GET sozinho sai na
+    hora, e os que foram disparados juntos (ex.: num asyncio.gather) vão no mesmo
+    /batch. Cada chamador recebe só a sua resposta; pedidos repetidos do mesmo
+    caminho compartilham o resultado. Caminhos com vírgula (não suportados pelo
+    /batch) vão direto.
+    """
+
+    def __init__(self, user_id: int, max_itens: int = BATCH_MAX_ITEMS):
+        self._user_id = user_id
+        self._max_itens = max_itens
+        self._pendentes: Dict[str, asyncio.Future] = {}
+        self._agendado: Optional[asyncio.Handle] = None
+
+    async def get(self, path: str):
+        if "," in path:
+            return await trello_request_for_user(self._user_id, "GET", path)
+
+        fut = self._pendentes.get(path)
+        if fut is None:
+            fut = asyncio.get_running_loop().create_future()
+            self._pendentes[path] = fut
+            if len(self._pendentes) >= self._max_itens:
+                self._disparar()
+            elif self._agendado is None:
+                self._agendado = asyncio.get_running_loop().call_soon(self._disparar)
+        return await asyncio.shield(fut)
+
+    def _disparar(self):
+        if self._agendado is not None:
+            self._agendado.cancel()
+            self._agendado = None
+        lote, self._pendentes = self._pendentes, {}
+        if lote:
+            _spawn(self._enviar(lote))
+
+    async def _enviar(self, lote: Dict[str, asyncio.Future]):
+        paths = list(lote)
+        try:
+            if len(paths) == 1:
+                respostas = [{"200": await trello_request_for_user(self._user_id, "GET", paths[0])}]
+            else:
+                respostas = await trello_request_for_user(self._user_id, "GET", "/batch",
+                                                          params={"urls": ",".join(paths)})
+        except Exception as e:
+            for fut in lote.values():
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+
+        for path, resposta in zip(paths, respostas):
+            fut = lote[path]
+            if fut.done():
+                continue
+            if "200" in resposta:
+                fut.set_result(resposta["200"])
+            else:
+                fut.set_exception(ValueError(f"Erro no batch do Trello para {path}: {resposta}"))
+
+
+# some sozinho quando nenhum GET do usuário está usando o batcher
+_batchers: "weakref.WeakValueDictionary[int, TrelloBatcher]" = weakref.WeakValueDictionary()
+
+
+def trello_get_batched(user_id: int, path: str):
+    """GET agrupado com outros GETs do mesmo usuário (ver TrelloBatcher)"""
+    batcher = _batchers.get(user_id)
+    if batcher is None:
+        batcher = _batchers[user_id] = TrelloBatcher(user_id)
+    return batcher.get(path)
+
+
 # convenience wrappers
-def get_board_lists(user_id: int, board_id: str):
-    return trello_request_for_user(user_id, "GET", f"/boards/{board_id}/lists")
+def board_lists_path(board_id: str) -> str:
+    # só listas abertas e só o nome (o id sempre vem); sem vírgulas para caber no /batch
+    return f"/boards/{board_id}/lists?fields=name&filter=open"
+
+
+async def get_board_lists(user_id: int, board_id: str):
+    return await trello_get_batched(user_id, board_lists_path(board_id))
+
+
+async def get_board_cards(user_id: int, board_id: str):
+    return await trello_request_for_user(user_id, "GET", f"/boards/{board_id}/cards",
+                                         params={"fields": "name,desc,due,idList"})
+
+
+async def get_card_by_id(user_id: int, card_id: str):
+    return await trello_request_for_user(user_id, "GET", f"/cards/{card_id}")
+
+
+async def get_card_full(user_id: int, card_id: str):
+    """Busca o cartão com checklists, comentários, anexos, membros e etiquetas numa única requisição"""
+    return await trello_request_for_user(user_id, "GET", f"/cards/{card_id}", params={
+        "fields": "name,desc,due,idList,labels",
+        "checklists": "all",
+        "checklist_fields": "name",
+        "checkItem_fields": "state",
+        "actions": "commentCard",
+        "action_fields": "data",
+        "attachments": "true",
+        "attachment_fields": "name,url,bytes",
+        "members": "true",
+        "member_fields": "fullName,username",
+    })
+
+
+async def get_card_checklists(user_id: int, card_id: str):
+    return await trello_request_for_user(user_id, "GET", f"/cards/{card_id}/checklists")
+
+
+async def get_card_comments(user_id: int, card_id: str):
+    return await trello_request_for_user(user_id, "GET", f"/cards/{card_id}/actions",
+                                         params={"filter": "commentCard"})
 
 
-def get_board_cards(user_id: int, board_id: str):
-    return trello_request_for_user(user_id, "GET", f"/boards/{board_id}/cards")
+async def get_card_attachments(user_id: int, card_id: str):
+    return await trello_request_for_user(user_id, "GET", f"/cards/{card_id}/attachments",
+                                         params={"fields": "name,url,bytes"})
 
 
-def get_card_by_id(user_id: int, card_id: str):
-    return trello_request_for_user(user_id, "GET", f"/cards/{card_id}")
+async def get_board_labels(user_id: int, board_id: str):
+    # o padrão do Trello corta em 50 etiquetas; os campos padrão já são só os necessários
+    return await trello_get_batched(user_id, f"/boards/{board_id}/labels?limit=1000")
 
 
-def get_card_checklists(user_id: int, card_id: str):
-    return trello_request_for_user(user_id, "GET", f"/cards/{card_id}/checklists")
+async def get_board_members(user_id: int, board_id: str):
+    # os campos padrão já são só id, fullName e username
+    return await trello_get_batched(user_id, f"/boards/{board_id}/members")
 
 
-def get_card_comments(user_id: int, card_id: str):
-    return trello_request_for_user(user_id, "GET", f"/cards/{card_id}/actions", params={"filter": "commentCard"})
+# listas/etiquetas/membros por (tipo, user_id, board_id) -> (momento da busca, dados, {nome normalizado: item})
+_board_cache: Dict[tuple, tuple] = {}
 
+# tipo -> (função que busca no Trello, campo usado como nome no índice)
+_DADOS_QUADRO = {
+    "lists": (get_board_lists, "name"),
+    "labels": (get_board_labels, "name"),
+    "members": (get_board_members, "fullName"),
+}
 
-def get_card_attachments(user_id: int, card_id: str):
-    return trello_request_for_user(user_id, "GET", f"/cards/{card_id}/attachments")
 
+def guardar_dados_quadro(tipo: str, user_id: int, board_id: str, dados):
+    """Coloca no cache dados do quadro obtidos por outro caminho (ex.: /batch)"""
+    # o índice por nome é montado uma vez por busca e serve a todas as consultas por nome
+    indice = indexar_por_nome(dados, _DADOS_QUADRO[tipo][1])
+    _board_cache[(tipo, user_id, board_id)] = (time.monotonic(), dados, indice)
 
-def get_board_labels(user_id: int, board_id: str):
-    return trello_request_for_user(user_id, "GET", f"/boards/{board_id}/labels")
 
+def cache_invalidate(user_id: int, board_id: str):
+    """Descarta listas, etiquetas e membros do quadro em cache (botões "🔄 Atualizar")"""
+    for tipo in _DADOS_QUADRO:
+        _board_cache.pop((tipo, user_id, board_id), None)
 
-def create_checklist(user_id: int, card_id: str, name: str):
-    return trello_request_for_user(user_id, "POST", f"/cards/{card_id}/checklists", params={"name": name})
 
+def invalidar_quadro_do_usuario(user_id: int):
+    """cache_invalidate do quadro configurado pelo usuário"""
+    ud = load_users().get(str(user_id))
+    if ud:
+        cache_invalidate(user_id, ud["board_id"])
 
-def add_checkitem(user_id: int, checklist_id: str, name: str):
-    return trello_request_for_user(user_id, "POST", f"/checklists/{checklist_id}/checkItems", params={"name": name})
 
+async def _entrada_quadro_cached(tipo: str, user_id: int, board_id: str, ttl: float):
+    em_cache = _board_cache.get((tipo, user_id, board_id))
+    if em_cache and time.monotonic() - em_cache[0] < ttl:
+        return em_cache
+    dados = await _DADOS_QUADRO[tipo][0](user_id, board_id)
+    guardar_dados_quadro(tipo, user_id, board_id, dados)
+    return _board_cache[(tipo, user_id, board_id)]
 
-def delete_checklist(user_id: int, checklist_id: str):
-    return trello_request_for_user(user_id, "DELETE", f"/checklists/{checklist_id}")
 
+async def get_board_lists_cached(user_id: int, board_id: str, ttl: float = BOARD_CACHE_TTL):
+    """get_board_lists reaproveitando o resultado por até `ttl` segundos"""
+    return (await _entrada_quadro_cached("lists", user_id, board_id, ttl))[1]
 
-def mark_checkitem(user_id: int, card_id: str, id_checkitem: str, state: str):
-    return trello_request_for_user(user_id, "PUT", f"/cards/{card_id}/checkItem/{id_checkitem}",
-                                   params={"state": state})
 
+async def get_board_labels_cached(user_id: int, board_id: str, ttl: float = BOARD_CACHE_TTL):
+    """get_board_labels reaproveitando o resultado por até `ttl` segundos"""
+    return (await _entrada_quadro_cached("labels", user_id, board_id, ttl))[1]
 
-def delete_checkitem(user_id: int, card_id: str, id_checkitem: str):
-    return trello_request_for_user(user_id, "DELETE", f"/cards/{card_id}/checkItem/{id_checkitem}")
 
+async def get_board_members_cached(user_id: int, board_id: str, ttl: float = BOARD_CACHE_TTL):
+    """get_board_members reaproveitando o resultado por até `ttl` segundos"""
+    return (await _entrada_quadro_cached("members", user_id, board_id, ttl))[1]
 
-def move_card(user_id: int, card_id: str, list_name: str):
-    card = get_card_by_id(user_id, card_id)
+
+async def buscar_no_quadro_por_nome(tipo: str, user_id: int, board_id: str, nome: str,
+                                    ttl: float = BOARD_CACHE_TTL) -> Optional[Dict[str, Any]]:
+    """Lista/etiqueta/membro (`tipo` como no cache) pelo nome, sem diferenciar acentos e maiúsculas"""
+    return (await _entrada_quadro_cached(tipo, user_id, board_id, ttl))[2].get(normalize_text(nome))
+
+
+async def create_checklist(user_id: int, card_id: str, name: str):
+    return await trello_request_for_user(user_id, "POST", f"/cards/{card_id}/checklists", params={"name": name})
+
+
+async def add_checkitem(user_id: int, checklist_id: str, name: str, pos: Optional[int] = None):
+    params = {"name": name}
+    if pos is not None:
+        params["pos"] = pos
+    return await trello_request_for_user(user_id, "POST", f"/checklists/{checklist_id}/checkItems",
+                                         params=params)
+
+
+async def add_checkitems(user_id: int, checklist_id: str, items: List[str]):
+    """Adiciona os itens em paralelo; o `pos` explícito mantém a ordem da lista no Trello"""
+    return await asyncio.gather(*(
+        add_checkitem(user_id, checklist_id, item, pos=(idx + 1) * 100) for idx, item in enumerate(items)
+    ))
+
+
+async def delete_checklist(user_id: int, checklist_id: str):
+    return await trello_request_for_user(user_id, "DELETE", f"/checklists/{checklist_id}")
+
+
+async def mark_checkitem(user_id: int, card_id: str, id_checkitem: str, state: str):
+    return await trello_request_for_user(user_id, "PUT", f"/cards/{card_id}/checkItem/{id_checkitem}",
+                                         params={"state": state})
+
+
+async def delete_checkitem(user_id: int, card_id: str, id_checkitem: str):
+    return await trello_request_for_user(user_id, "DELETE", f"/cards/{card_id}/checkItem/{id_checkitem}")
+
+
+async def move_card(user_id: int, card_id: str, list_name: str):
+    card = await get_card_by_id(user_id, card_id)
     board_id = card.get("idBoard")
-    lists = get_board_lists(user_id, board_id)
-    for l in lists:
-        if normalize_text(l.get("name")) == normalize_text(list_name):
-            return trello_request_for_user(user_id, "PUT", f"/cards/{card_id}", params={"idList": l.get("id")})
+    l = await buscar_no_quadro_por_nome("lists", user_id, board_id, list_name)
+    if l:
+        return await trello_request_for_user(user_id, "PUT", f"/cards/{card_id}", params={"idList": l.get("id")})
     return None
 
 
-def add_comment(user_id: int, card_id: str, text: str):
-    return trello_request_for_user(user_id, "POST", f"/cards/{card_id}/actions/comments", params={"text": text})
+async def add_comment(user_id: int, card_id: str, text: str):
+    return await trello_request_for_user(user_id, "POST", f"/cards/{card_id}/actions/comments",
+                                         params={"text": text})
 
 
-def update_card_field(user_id: int, card_id: str, fields: Dict[str, Any]):
-    return trello_request_for_user(user_id, "PUT", f"/cards/{card_id}", params=fields)
+async def update_card_field(user_id: int, card_id: str, fields: Dict[str, Any]):
+    return await trello_request_for_user(user_id, "PUT", f"/cards/{card_id}", params=fields)
 
 
-def upload_file_to_card(user_id: int, card_id: str, local_path: str, filename: Optional[str] = None):
+async def upload_file_to_card(user_id: int, card_id: str, local_path: str, filename: Optional[str] = None):
     u = user_data_or_raise(user_id)
     url = API_BASE + f"/cards/{card_id}/attachments"
-    params = {"key": u["api_key"], "token": u["token"]}
+    headers = _auth_header(u)
+    # O arquivo é aberto uma vez só e reaproveitado nas novas tentativas. O httpx
+    # calcula o Content-Length do multipart pelo tamanho do arquivo e o envia em
+    # partes, sem carregar o corpo inteiro na memória.
     with open(local_path, "rb") as f:
         files = {"file": (filename or os.path.basename(local_path), f)}
-        resp = requests.post(url, params=params, files=files, timeout=120)
-    if not resp.ok:
+
+        async def enviar():
+            f.seek(0)  # uma nova tentativa precisa reenviar o arquivo desde o início
+            return await http_client().post(url, files=files, headers=headers, timeout=120)
+
+        resp = await _enviar_ao_trello(enviar, _rate_limiter(u), idempotente=False)
+    if resp.is_error:
         logger.error("Erro upload arquivo: %s", resp.text)
     resp.raise_for_status()
     try:
@@ -251,50 +870,166 @@ def upload_file_to_card(user_id: int, card_id: str, local_path: str, filename: O
 
 # -------------------- Sistema de Rascunhos para PDFs --------------------
 
-def salvar_rascunho(user_id: int, dados_cartao: Dict[str, Any]):
-    """Salva um rascunho de cartão em arquivo temporário"""
-    user_dir = os.path.join(RASCUNHOS_DIR, str(user_id))
-    os.makedirs(user_dir, exist_ok=True)
+class RascunhoStore:
+    """Mantém os rascunhos de cada usuário em memória e grava no SQLite em segundo plano.
+
+    Cada rascunho é uma linha da tabela `rascunhos`, chaveada por (user_id, idx).
+    Leituras e alterações são apenas operações em dicionário; os rascunhos alterados
+    ficam marcados e só essas linhas são gravadas (fora do event loop) no máximo
+    uma vez por intervalo.
+    """
+
+    def __init__(self, db_path: str, legado_dir: str, intervalo: float = 1.0):
+        self._db_path = db_path
+        self._legado_dir = legado_dir
+        self._intervalo = intervalo
+        self._cache: Dict[int, List[Dict[str, Any]]] = {}
+        # user_id -> índices alterados (None = regravar todos os rascunhos do usuário)
+        self._dirty: Dict[int, Optional[set]] = {}
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        with closing(self._conectar()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rascunhos ("
+                "user_id INTEGER NOT NULL, idx INTEGER NOT NULL, data BLOB NOT NULL, "
+                "editado INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (user_id, idx))"
+            )
+
+    def _conectar(self) -> sqlite3.Connection:
+        # uma conexão por operação: as gravações rodam em outra thread
+        return sqlite3.connect(self._db_path)
+
+    def _ler_legado(self, user_id: int) -> List[Dict[str, Any]]:
+        user_dir = os.path.join(self._legado_dir, str(user_id))
+        if not os.path.isdir(user_dir):
+            return []
+
+        arquivos = [f for f in os.listdir(user_dir) if f.startswith('rascunho_') and f.endswith('.json')]
+        arquivos.sort(key=lambda f: int(f[len('rascunho_'):-len('.json')] or 0))
+
+        rascunhos = []
+        for arquivo in arquivos:
+            try:
+                with open(os.path.join(user_dir, arquivo), 'rb') as f:
+                    rascunhos.append(orjson.loads(f.read()))
+            except Exception as e:
+                logger.warning(f"Erro ao carregar rascunho {arquivo}: {e}")
+
+        return rascunhos
+
+    def _ler_db(self, user_id: int) -> List[Dict[str, Any]]:
+        with closing(self._conectar()) as conn:
+            linhas = conn.execute(
+                "SELECT data FROM rascunhos WHERE user_id = ? ORDER BY idx", (user_id,)
+            ).fetchall()
+        return [orjson.loads(data) for (data,) in linhas]
+
+    def _gravar_db(self, user_id: int, linhas: List[tuple], total: int, completo: bool):
+        with closing(self._conectar()) as conn, conn:
+            if completo:
+                conn.execute("DELETE FROM rascunhos WHERE user_id = ?", (user_id,))
+            else:
+                conn.execute("DELETE FROM rascunhos WHERE user_id = ? AND idx >= ?", (user_id, total))
+            conn.executemany(
+                "INSERT INTO rascunhos (user_id, idx, data, editado) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (user_id, idx) DO UPDATE SET data = excluded.data, editado = excluded.editado",
+                [(user_id, idx, data, editado) for idx, data, editado in linhas],
+            )
+        # rascunhos já migrados não precisam mais dos arquivos antigos
+        user_dir = os.path.join(self._legado_dir, str(user_id))
+        if completo and os.path.isdir(user_dir):
+            shutil.rmtree(user_dir, ignore_errors=True)
+
+    def carregar(self, user_id: int) -> List[Dict[str, Any]]:
+        rascunhos = self._cache.get(user_id)
+        if rascunhos is None:
+            rascunhos = self._ler_db(user_id)
+            if not rascunhos:
+                rascunhos = self._ler_legado(user_id)
+                if rascunhos:
+                    self.marcar_alterado(user_id)
+            self._cache[user_id] = rascunhos
+        return rascunhos
+
+    def marcar_alterado(self, user_id: int, index: Optional[int] = None):
+        """Marca o rascunho `index` (ou, sem índice, todos os do usuário) para gravação"""
+        if index is None:
+            self._dirty[user_id] = None
+        elif user_id not in self._dirty:
+            self._dirty[user_id] = {index}
+        elif self._dirty[user_id] is not None:
+            self._dirty[user_id].add(index)
+
+    def limpar(self, user_id: int):
+        self._cache[user_id] = []
+        self.marcar_alterado(user_id)
+
+    async def _flush_dirty(self):
+        async with self._lock:
+            while self._dirty:
+                user_id, indices = self._dirty.popitem()
+                rascunhos = self._cache.get(user_id)
+                if rascunhos is None:
+                    continue
+                # Serializa no event loop (os dicts podem mudar) e grava em outra thread
+                if indices is None:
+                    indices = range(len(rascunhos))
+                linhas = [(i, orjson.dumps(rascunhos[i]), bool(rascunhos[i].get("editado")))
+                          for i in sorted(indices) if i < len(rascunhos)]
+                try:
+                    await asyncio.to_thread(self._gravar_db, user_id, linhas, len(rascunhos),
+                                            len(linhas) == len(rascunhos))
+                except Exception as e:
+                    logger.exception(f"Erro ao gravar rascunhos do usuário {user_id}: {e}")
+                    self.marcar_alterado(user_id)
+                    return
+
+    async def _flusher(self):
+        while True:
+            await asyncio.sleep(self._intervalo)
+            await self._flush_dirty()
 
-    arquivo_rascunho = os.path.join(user_dir, f"rascunho_{len(os.listdir(user_dir))}.json")
+    def iniciar(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flusher())
 
-    with open(arquivo_rascunho, 'w', encoding='utf-8') as f:
-        json.dump(dados_cartao, f, ensure_ascii=False, indent=2)
+    async def encerrar(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self._flush_dirty()
 
-    return arquivo_rascunho
+
+rascunho_store = RascunhoStore(RASCUNHOS_DB, RASCUNHOS_DIR)
+
+
+def salvar_rascunho(user_id: int, dados_cartao: Dict[str, Any]) -> int:
+    """Salva um novo rascunho de cartão e retorna o seu índice"""
+    rascunhos = rascunho_store.carregar(user_id)
+    rascunhos.append(dados_cartao)
+    rascunho_store.marcar_alterado(user_id, len(rascunhos) - 1)
+    return len(rascunhos) - 1
 
 
 def carregar_rascunhos(user_id: int) -> List[Dict[str, Any]]:
     """Carrega todos os rascunhos de um usuário"""
-    user_dir = os.path.join(RASCUNHOS_DIR, str(user_id))
-    if not os.path.exists(user_dir):
-        return []
+    return rascunho_store.carregar(user_id)
 
-    rascunhos = []
-    for arquivo in os.listdir(user_dir):
-        if arquivo.startswith('rascunho_') and arquivo.endswith('.json'):
-            try:
-                with open(os.path.join(user_dir, arquivo), 'r', encoding='utf-8') as f:
-                    rascunhos.append(json.load(f))
-            except Exception as e:
-                logger.warning(f"Erro ao carregar rascunho {arquivo}: {e}")
 
-    return rascunhos
+def rascunho_no_indice(user_id: int, index: Optional[int]) -> Optional[Dict[str, Any]]:
+    """O rascunho na posição `index`, ou None se ela não existe mais"""
+    rascunhos = rascunho_store.carregar(user_id)
+    if index is not None and 0 <= index < len(rascunhos):
+        return rascunhos[index]
+    return None
 
 
 def atualizar_rascunho(user_id: int, index: int, dados_atualizados: Dict[str, Any]):
     """Atualiza um rascunho específico"""
-    user_dir = os.path.join(RASCUNHOS_DIR, str(user_id))
-    if not os.path.exists(user_dir):
-        return False
-
-    arquivos = [f for f in os.listdir(user_dir) if f.startswith('rascunho_') and f.endswith('.json')]
-    arquivos.sort()
-
-    if 0 <= index < len(arquivos):
-        arquivo_rascunho = os.path.join(user_dir, arquivos[index])
-        with open(arquivo_rascunho, 'w', encoding='utf-8') as f:
-            json.dump(dados_atualizados, f, ensure_ascii=False, indent=2)
+    rascunhos = rascunho_store.carregar(user_id)
+    if 0 <= index < len(rascunhos):
+        rascunhos[index] = dados_atualizados
+        rascunho_store.marcar_alterado(user_id, index)
         return True
 
     return False
@@ -302,9 +1037,7 @@ def atualizar_rascunho(user_id: int, index: int, dados_atualizados: Dict[str, An
 
 def limpar_rascunhos(user_id: int):
     """Limpa todos os rascunhos de um usuário"""
-    user_dir = os.path.join(RASCUNHOS_DIR, str(user_id))
-    if os.path.exists(user_dir):
-        shutil.rmtree(user_dir)
+    rascunho_store.limpar(user_id)
 
 
 # -------------------- Extração de PDF --------------------
@@ -403,6 +1136,14 @@ def extract_info_from_pdf(pdf_path):
         return None
 
 
+async def extrair_pdf(context: ContextTypes.DEFAULT_TYPE, pdf_path: str):
+    """extract_info_from_pdf fora do event loop: no pool de processos do bot, ou numa thread se não houver"""
+    pool = context.bot_data.get("pdf_pool")
+    if pool is None:
+        return await asyncio.to_thread(extract_info_from_pdf, pdf_path)
+    return await asyncio.get_running_loop().run_in_executor(pool, extract_info_from_pdf, pdf_path)
+
+
 # -------------------- Presentation utils --------------------
 
 
@@ -423,6 +1164,35 @@ def chunk_text(s: str, max_len: int = MAX_MSG_CHARS) -> List[str]:
     return parts
 
 
+_UNITS = ((1, 'B'), (1024, 'KB'), (1024 * 1024, 'MB'), (1024 * 1024 * 1024, 'GB'))
+
+
+def fmt_size(n: int) -> str:
+    """Formata um tamanho em bytes (B, KB, MB ou GB)"""
+    i = min(max(0, (n.bit_length() - 1) // 10), len(_UNITS) - 1)
+    d, u = _UNITS[i]
+    return f"{n / d:.1f} {u}" if i else f"{n} B"
+
+
+def _short(s: str, n: int = SHORT_LIMIT) -> str:
+    """Corta `s` em `n` caracteres, terminando com "..." quando precisar cortar"""
+    return s if len(s) <= n else f"{s[:n - 3]}..."
+
+
+def limitar_mensagem(s: str, max_len: int = MAX_MSG_CHARS) -> str:
+    """Corta a mensagem (em fim de linha) para caber numa única mensagem do Telegram"""
+    if len(s) <= max_len:
+        return s
+    return chunk_text(s, max_len)[0].rstrip() + "\n\n… use os botões para navegar"
+
+
+def fmt_due(s: str) -> str:
+    """Converte a data ISO do Trello (aaaa-mm-ddTHH:MM:SS.sssZ) para dd/mm/aaaa"""
+    if len(s) < 10:
+        return s
+    return f"{s[8:10]}/{s[5:7]}/{s[0:4]}"
+
+
 def parse_date_ddmmaa(s: str) -> Optional[str]:
     """Converte data dd/mm/aaaa para formato ISO do Trello com horário 16:00"""
     try:
@@ -434,8 +1204,134 @@ def parse_date_ddmmaa(s: str) -> Optional[str]:
         return None
 
 
+class _MsgAsQuery:
+    """Adapta uma mensagem de texto para as funções que esperam um CallbackQuery"""
+    __slots__ = ('from_user', 'edit_message_text', 'message')
+
+    def __init__(self, update: Update):
+        self.from_user = update.effective_user
+        self.message = update.message
+        # Sem mensagem do bot para editar: responde com uma nova mensagem
+        self.edit_message_text = update.message.reply_text
+
+    async def answer(self, text: Optional[str] = None, **kwargs):
+        if text:
+            await self.message.reply_text(text)
+
+
+async def editar_render(query, context, text: str, reply_markup: InlineKeyboardMarkup, aviso: str = "✅"):
+    """Edita a mensagem do callback só se o conteúdo mudou; senão apenas responde `aviso`.
+
+    Guarda em context.user_data o hash da última renderização de cada mensagem. O
+    teclado atual da mensagem (que vem no próprio callback) também precisa bater, para
+    não pular uma edição quando outra tela foi desenhada por cima.
+    """
+    h = hashlib.blake2b(text.encode() + repr(reply_markup.to_dict()).encode(), digest_size=8).digest()
+    chave = (getattr(query.message, "message_id", None), h)
+    atual = getattr(query.message, "reply_markup", None)
+    if context.user_data.get("_last_render_hash") == chave and atual == reply_markup:
+        await query.answer(aviso)
+        return
+
+    try:
+        await query.edit_message_text(text, parse_mode="Markdown", reply_markup=reply_markup)
+    except BadRequest as e:
+        if "Message is not modified" not in str(e):
+            raise e
+        await query.answer(aviso)
+    context.user_data["_last_render_hash"] = chave
+
+
+def callback_data(rota: str, *args) -> str:
+    """callback_data compacto e versionado: "v1:<rota>:<arg>..." (o Telegram aceita até 64 bytes)"""
+    return ":".join((CALLBACK_VERSION, rota, *map(str, args)))
+
+
+async def editar_botao(query, linha: int, texto: str) -> bool:
+    """Troca só o texto do botão da `linha` no teclado atual da mensagem (editMessageReplyMarkup).
+
+    Devolve False se a mensagem não trouxe o teclado; aí quem chamou redesenha a tela.
+    """
+    atual = getattr(query.message, "reply_markup", None)
+    if atual is None or linha >= len(atual.inline_keyboard):
+        return False
+    linhas = list(atual.inline_keyboard)
+    linhas[linha] = (InlineKeyboardButton(texto, callback_data=linhas[linha][0].callback_data),)
+    try:
+        await query.edit_message_reply_markup(reply_markup=InlineKeyboardMarkup(linhas))
+    except BadRequest as e:
+        if "Message is not modified" not in str(e):
+            raise e
+    return True
+
+
+class Progresso:
+    """Uma única mensagem de progresso, editada a cada `a_cada` itens ou `intervalo` segundos.
+
+    Evita uma mensagem nova por item; a última edição sempre mostra o total.
+    """
+
+    def __init__(self, mensagem, total: int, texto: str, a_cada: int = 5, intervalo: float = 2.0):
+        self._mensagem = mensagem
+        self._total = total
+        self._texto = texto
+        self._a_cada = a_cada
+        self._intervalo = intervalo
+        self._feitos = 0
+        self._mostrados = 0
+        self._editado_em = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def avancar(self):
+        self._feitos += 1
+        async with self._lock:
+            if self._mostrados == self._feitos:
+                return
+            if (self._feitos - self._mostrados < self._a_cada and self._feitos < self._total
+                    and time.monotonic() - self._editado_em < self._intervalo):
+                return
+            self._mostrados = self._feitos
+            self._editado_em = time.monotonic()
+            try:
+                await self._mensagem.edit_text(f"{self._texto}: {self._feitos}/{self._total}")
+            except BadRequest as e:
+                logger.warning(f"Erro ao atualizar progresso: {e}")
+
+
 # -------------------- Telegram Handlers --------------------
 
+# Instruções enviadas ao entrar em cada modo guiado (ver enter_mode)
+PROMPTS = {
+    "checklist": "📋 *Modo de adição de checklist*\n\nEnvie o nome da checklist:",
+    "data": "📅 *Modo de edição de data*\n\nEnvie a nova data no formato dd/mm/aaaa:",
+    "comentario": "💬 *Modo de adição de comentário*\n\nEnvie o comentário:",
+    "comentario_existente": (
+        "💬 *Modo de adição de comentário*\n\n"
+        "Por favor, envie o comentário que deseja adicionar ao cartão:"
+    ),
+    "anexo": (
+        "📎 *Modo de adição de anexos*\n\n"
+        "Agora envie os arquivos que deseja anexar.\n"
+        "✅ *Aceita qualquer tipo de arquivo:* imagens, PDFs, documentos, etc.\n\n"
+        "Após enviar todos os arquivos, use:\n"
+        "• `/ok` para finalizar e voltar à edição\n"
+        "• `/cancelar` para cancelar a operação\n\n"
+        "Ou clique no botão abaixo para finalizar:"
+    ),
+    "anexo_existente": (
+        "📎 *Modo de adição de anexos*\n\n"
+        "Agora envie os arquivos que deseja anexar ao cartão.\n"
+        "✅ *Aceita qualquer tipo de arquivo:* imagens, PDFs, documentos, etc.\n\n"
+        "Após enviar todos os arquivos, use:\n"
+        "• `/ok` para finalizar e adicionar os anexos\n"
+        "• `/cancelar` para cancelar a operação\n\n"
+        "Ou clique no botão abaixo para finalizar:"
+    ),
+}
+
+# Botão de finalizar do modo de anexos (os objetos do teclado são imutáveis, então um só serve a todos)
+ANEXO_KB = InlineKeyboardMarkup([[InlineKeyboardButton("✅ Finalizar Anexos", callback_data="finalizar_anexos")]])
+
 HELP_TEXT = (
     "Comandos:\n"
     "/start - configurar credenciais (API Key, Token, Board ID)\n"
@@ -454,14 +1350,14 @@ async def start_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(
             "Você já tem credenciais salvas. Use /config para reconfigurar ou use os comandos.\n" + HELP_TEXT)
         return
-    user_states[user_id] = {"flow": "register_api_key", "buffer": {}}
+    await state_store.set(user_id, {"flow": "register_api_key", "buffer": {}})
     await update.message.reply_text("Olá! Vamos configurar seu Trello. Envie sua *Trello API Key* (cole aqui):",
                                     parse_mode="Markdown")
 
 
 async def config_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    user_states[user_id] = {"flow": "register_api_key", "buffer": {}}
+    await state_store.set(user_id, {"flow": "register_api_key", "buffer": {}})
     await update.message.reply_text("Reconfiguração iniciada. Envie sua Trello API Key:")
 
 
@@ -478,7 +1374,7 @@ async def addchk_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
 
         # Verifica se há um cartão selecionado
-        state = user_states.get(user_id, {})
+        state = await state_store.get(user_id)
         if not state.get("selected_card"):
             await update.message.reply_text(
                 "❌ Nenhum cartão selecionado.\n\n"
@@ -490,7 +1386,7 @@ async def addchk_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Inicia o modo de criação de checklist
         state["mode"] = "add_checklist"
         state["checklist_stage"] = "aguardando_nome"
-        user_states[user_id] = state
+        await state_store.set(user_id, state)
 
         await update.message.reply_text(
             "📝 **Modo de Criação de Checklist**\n\n"
@@ -503,30 +1399,41 @@ async def addchk_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"❌ Erro ao iniciar modo de checklist: {str(e)}")
 
 
-async def add_checklist_cartao(update: Update, context: ContextTypes.DEFAULT_TYPE, index_cartao: int):
-    """Inicia modo de adição de checklist para um cartão específico"""
-    user_id = update.effective_user.id if update.message else update.callback_query.from_user.id
-
-    state = user_states.get(user_id, {})
-    state.update({
-        "mode": "add_checklist_pdf",  # Modo específico para PDFs
-        "checklist_stage": "aguardando_nome",
-        "index_cartao": index_cartao,
-        "buffer": []
-    })
-    user_states[user_id] = state
+async def enter_mode(update: Update, *, mode: str, index: int, prompt: str, index_key: str = "index_cartao",
+                     extra_state: Optional[Dict[str, Any]] = None, keyboard: Optional[InlineKeyboardMarkup] = None,
+                     editar: bool = False):
+    """Coloca o usuário em um modo guiado para o cartão `index` e envia as instruções.
 
-    mensagem = "📋 *Modo de adição de checklist*\n\nEnvie o nome da checklist:"
+    Anexos pendentes de um modo anterior são descartados. Com `editar`, as instruções
+    substituem a mensagem do callback em vez de irem numa mensagem nova.
+    """
+    user_id = update.effective_user.id
+    state = await state_store.get(user_id)
+    _descartar_anexos(state)
+    state.update({"mode": mode, index_key: index, **(extra_state or {})})
+    await state_store.set(user_id, state)
 
-    if update.callback_query:
-        await update.callback_query.message.reply_text(mensagem, parse_mode="Markdown")
+    query = update.callback_query
+    if editar:
+        await query.answer()
+        await query.edit_message_text(prompt, parse_mode="Markdown", reply_markup=keyboard)
     else:
-        await update.message.reply_text(mensagem, parse_mode="Markdown")
+        target = query.message if query else update.message
+        await target.reply_text(prompt, parse_mode="Markdown", reply_markup=keyboard)
+
+
+async def add_checklist_cartao(update: Update, context: ContextTypes.DEFAULT_TYPE, index_cartao: int):
+    """Inicia modo de adição de checklist para um cartão específico"""
+    await enter_mode(
+        update, mode="add_checklist_pdf", index=index_cartao,  # Modo específico para PDFs
+        extra_state={"checklist_stage": "aguardando_nome", "buffer": []},
+        prompt=PROMPTS["checklist"],
+    )
 
 
 async def handle_checklist_creation(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int, text: str):
     """Manipula a criação de checklist em etapas"""
-    state = user_states.get(user_id, {})
+    state = await state_store.get(user_id)
 
     # Verifica se está no modo de checklist normal OU no modo de checklist para PDFs
     if state.get("mode") not in ["add_checklist", "add_checklist_pdf"]:
@@ -543,7 +1450,6 @@ async def handle_checklist_creation(update: Update, context: ContextTypes.DEFAUL
 
         state["checklist_name"] = text.strip()
         state["checklist_stage"] = "aguardando_itens"
-        user_states[user_id] = state
 
         await update.message.reply_text(
             f"✅ Nome da checklist definido como: *{text.strip()}*\n\n"
@@ -594,7 +1500,6 @@ async def handle_checklist_creation(update: Update, context: ContextTypes.DEFAUL
                     state["checklist_stage"] = None
                     state["checklist_name"] = None
                     state["index_cartao"] = None
-                    user_states[user_id] = state
 
                     # Mensagem de sucesso
                     items_list = "\n".join([f"• {item}" for item in items])
@@ -606,11 +1511,7 @@ async def handle_checklist_creation(update: Update, context: ContextTypes.DEFAUL
                     )
 
                     # Volta para as opções de edição
-                    fake_query = type('Obj', (object,), {
-                        'from_user': update.effective_user,
-                        'edit_message_text': update.message.reply_text,
-                        'message': update.message
-                    })
+                    fake_query = _MsgAsQuery(update)
                     await mostrar_opcoes_edicao(fake_query, context, index_cartao)
                 else:
                     await update.message.reply_text("❌ Cartão não encontrado.")
@@ -618,7 +1519,6 @@ async def handle_checklist_creation(update: Update, context: ContextTypes.DEFAUL
                     state["mode"] = None
                     state["checklist_stage"] = None
                     state["checklist_name"] = None
-                    user_states[user_id] = state
 
             except Exception as e:
                 logger.exception(f"Erro ao adicionar checklist ao PDF: {e}")
@@ -627,7 +1527,6 @@ async def handle_checklist_creation(update: Update, context: ContextTypes.DEFAUL
                 state["mode"] = None
                 state["checklist_stage"] = None
                 state["checklist_name"] = None
-                user_states[user_id] = state
 
         else:
             # Modo normal: cria no Trello
@@ -636,17 +1535,15 @@ async def handle_checklist_creation(update: Update, context: ContextTypes.DEFAUL
                 checklist_name = state.get("checklist_name")
 
                 # Cria a checklist
-                checklist = create_checklist(user_id, card_id, checklist_name)
+                checklist = await create_checklist(user_id, card_id, checklist_name)
 
                 # Adiciona os itens
-                for item in items:
-                    add_checkitem(user_id, checklist["id"], item)
+                await add_checkitems(user_id, checklist["id"], items)
 
                 # Limpa o estado
                 state["mode"] = None
                 state["checklist_stage"] = None
                 state["checklist_name"] = None
-                user_states[user_id] = state
 
                 # Mensagem de sucesso
                 items_list = "\n".join([f"• {item}" for item in items])
@@ -664,7 +1561,6 @@ async def handle_checklist_creation(update: Update, context: ContextTypes.DEFAUL
                 state["mode"] = None
                 state["checklist_stage"] = None
                 state["checklist_name"] = None
-                user_states[user_id] = state
 
         return True
 
@@ -674,286 +1570,289 @@ async def handle_checklist_creation(update: Update, context: ContextTypes.DEFAUL
 async def cancelar_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Cancela qualquer operação em andamento"""
     user_id = update.effective_user.id
-    state = user_states.get(user_id, {})
+    state = await state_store.get(user_id)
+    cancelar_lotes_pdf(user_id)
 
     if state.get("mode"):
         modo_anterior = state.get("mode")
-        # Limpa todos os estados ativos
-        user_states[user_id] = {"mode": None}
+        # Limpa todos os estados ativos (e os arquivos ainda não enviados)
+        _descartar_anexos(state)
+        await state_store.set(user_id, {"mode": None})
         await update.message.reply_text(f"❌ Operação '{modo_anterior}' cancelada.")
     else:
         await update.message.reply_text("Nenhuma operação ativa para cancelar.")
 
 
-async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    text = (update.message.text or "").strip()
-    if not text:
-        return
+async def _texto_checklist(update: Update, context: ContextTypes.DEFAULT_TYPE, state: Dict[str, Any], text: str):
+    """Etapas da criação de checklist (/addchk ou rascunho de PDF)"""
+    return await handle_checklist_creation(update, context, update.effective_user.id, text)
 
-    st = user_states.get(user_id)
-    if st and st.get("flow"):
-        flow = st["flow"]
-        if flow == "register_api_key":
-            st["buffer"]["api_key"] = text
-            st["flow"] = "register_token"
-            user_states[user_id] = st
-            await update.message.reply_text("OK. Agora envie seu *Trello Token*:", parse_mode="Markdown")
-            return
-        elif flow == "register_token":
-            st["buffer"]["token"] = text
-            st["flow"] = "register_board"
-            user_states[user_id] = st
-            await update.message.reply_text("Agora envie o *Board ID* (ID do quadro):", parse_mode="Markdown")
-            return
-        elif flow == "register_board":
-            st["buffer"]["board_id"] = text
-            buf = st["buffer"]
-            users = load_users()
-            users[str(user_id)] = {"api_key": buf.get("api_key"), "token": buf.get("token"),
-                                   "board_id": buf.get("board_id")}
-            save_users(users)
-            user_states[user_id] = {"mode": None}
-            await update.message.reply_text("Configuração salva ✅\n" + HELP_TEXT)
-            return
 
-    # Primeiro verifica se está no modo de criação de checklist
-    if await handle_checklist_creation(update, context, user_id, text):
-        return
+async def _texto_editar_data_cartao(update: Update, context: ContextTypes.DEFAULT_TYPE, state: Dict[str, Any],
+                                    text: str):
+    """Recebe a nova data de um cartão em criação (rascunho)"""
+    user_id = update.effective_user.id
+    index_cartao = state.get("index_cartao")
 
-    # Restante do código existente para outros modos...
-    state = st or {}
-    mode = state.get("mode")
+    nova_data = text.strip()
+    if parse_date_ddmmaa(nova_data):
+        rascunhos = carregar_rascunhos(user_id)
+        if rascunhos and 0 <= index_cartao < len(rascunhos):
+            rascunho = rascunhos[index_cartao]
+            rascunho["data_entrega"] = nova_data
+            rascunho["data_formatada"] = f"📅 Data entrega: {nova_data}"
+            rascunho["editado"] = True
+            atualizar_rascunho(user_id, index_cartao, rascunho)
+
+            await update.message.reply_text(f"✅ Data alterada para: {nova_data}")
+            # Volta para as opções de edição
+            fake_query = _MsgAsQuery(update)
+            await mostrar_opcoes_edicao(fake_query, context, index_cartao)
+        else:
+            await update.message.reply_text("Cartão não encontrado.")
+    else:
+        await update.message.reply_text("❌ Formato de data inválido. Use dd/mm/aaaa")
 
-    # Modos de edição de cartões PDF
-    if mode in ["editando_data_cartao", "adicionando_comentario_cartao"]:
-        index_cartao = state.get("index_cartao")
-        buffer = state.get("buffer", [])
-        buffer.append(text)
-        state["buffer"] = buffer
-        user_states[user_id] = state
-
-        if mode == "editando_data_cartao":
-            # Processa imediatamente a data
-            nova_data = text.strip()
-            if parse_date_ddmmaa(nova_data):
-                rascunhos = carregar_rascunhos(user_id)
-                if rascunhos and 0 <= index_cartao < len(rascunhos):
-                    rascunho = rascunhos[index_cartao]
-                    rascunho["data_entrega"] = nova_data
-                    rascunho["data_formatada"] = f"📅 Data entrega: {nova_data}"
-                    rascunho["editado"] = True
-                    atualizar_rascunho(user_id, index_cartao, rascunho)
+    # Reseta o estado
+    state["mode"] = None
+    state["buffer"] = []
+    return True
 
-                    await update.message.reply_text(f"✅ Data alterada para: {nova_data}")
-                    # Volta para as opções de edição
-                    fake_query = type('Obj', (object,), {
-                        'from_user': update.effective_user,
-                        'edit_message_text': update.message.reply_text,
-                        'message': update.message
-                    })
-                    await mostrar_opcoes_edicao(fake_query, context, index_cartao)
-                else:
-                    await update.message.reply_text("Cartão não encontrado.")
-            else:
-                await update.message.reply_text("❌ Formato de data inválido. Use dd/mm/aaaa")
 
-            # Reseta o estado
-            state["mode"] = None
-            state["buffer"] = []
-            user_states[user_id] = state
+async def _texto_comentario_cartao(update: Update, context: ContextTypes.DEFAULT_TYPE, state: Dict[str, Any],
+                                   text: str):
+    """Recebe o comentário de um cartão em criação (rascunho)"""
+    user_id = update.effective_user.id
+    index_cartao = state.get("index_cartao")
 
-        elif mode == "adicionando_comentario_cartao":
-            # Processa imediatamente o comentário
-            comentario = text.strip()
-            if comentario:
-                rascunhos = carregar_rascunhos(user_id)
-                if rascunhos and 0 <= index_cartao < len(rascunhos):
-                    rascunho = rascunhos[index_cartao]
-                    rascunho["comentarios"] = comentario
-                    rascunho["editado"] = True
-                    atualizar_rascunho(user_id, index_cartao, rascunho)
+    comentario = text.strip()
+    if comentario:
+        rascunhos = carregar_rascunhos(user_id)
+        if rascunhos and 0 <= index_cartao < len(rascunhos):
+            rascunho = rascunhos[index_cartao]
+            rascunho["comentarios"] = comentario
+            rascunho["editado"] = True
+            atualizar_rascunho(user_id, index_cartao, rascunho)
+
+            await update.message.reply_text("✅ Comentário adicionado")
+            # Volta para as opções de edição
+            fake_query = _MsgAsQuery(update)
+            await mostrar_opcoes_edicao(fake_query, context, index_cartao)
+        else:
+            await update.message.reply_text("Cartão não encontrado.")
 
-                    await update.message.reply_text("✅ Comentário adicionado")
-                    # Volta para as opções de edição
-                    fake_query = type('Obj', (object,), {
-                        'from_user': update.effective_user,
-                        'edit_message_text': update.message.reply_text,
-                        'message': update.message
-                    })
-                    await mostrar_opcoes_edicao(fake_query, context, index_cartao)
-                else:
-                    await update.message.reply_text("Cartão não encontrado.")
+    # Reseta o estado
+    state["mode"] = None
+    state["buffer"] = []
+    return True
 
-            # Reseta o estado
-            state["mode"] = None
-            state["buffer"] = []
-            user_states[user_id] = state
 
-        return
+async def _texto_anexo_cartao(update: Update, context: ContextTypes.DEFAULT_TYPE, state: Dict[str, Any], text: str):
+    """Finaliza (/ok) a adição de anexos a um cartão em criação (rascunho)"""
+    if text.lower() != "/ok":
+        return False
 
-    # Verifica se está no modo de adição de anexos
-    if state.get("mode") == "adicionando_anexo_cartao" and text.lower() == "/ok":
-        index_cartao = state.get("index_cartao")
-        anexos_temp = state.get("anexos", [])
-        
-        if anexos_temp:
-            # Salva os anexos no rascunho
-            rascunhos = carregar_rascunhos(user_id)
-            if rascunhos and 0 <= index_cartao < len(rascunhos):
-                rascunho = rascunhos[index_cartao]
-                if "anexos" not in rascunho:
-                    rascunho["anexos"] = []
-                
-                rascunho["anexos"].extend(anexos_temp)
-                rascunho["editado"] = True
-                atualizar_rascunho(user_id, index_cartao, rascunho)
-                
-                await update.message.reply_text(f"✅ {len(anexos_temp)} anexo(s) adicionado(s) ao cartão!")
-                
-                # Limpa o estado
-                state["mode"] = None
-                state["anexos"] = []
-                user_states[user_id] = state
-                
-                # Volta para as opções de edição
-                fake_query = type('Obj', (object,), {
-                    'from_user': update.effective_user,
-                    'edit_message_text': update.message.reply_text,
-                    'message': update.message
-                })
-                await mostrar_opcoes_edicao(fake_query, context, index_cartao)
-            else:
-                await update.message.reply_text("❌ Cartão não encontrado.")
-        else:
-            await update.message.reply_text("❌ Nenhum anexo foi enviado.")
-        
-        return
+    user_id = update.effective_user.id
+    index_cartao = state.get("index_cartao")
+    anexos_temp = state.get("anexos", [])
 
-    # Verifica se está no modo de adição de anexos para cartões existentes (busca)
-    if state.get("mode") == "adicionando_anexo_existente" and text.lower() == "/ok":
-        index_cartao = state.get("index_cartao_existente")
-        anexos_temp = state.get("anexos", [])
-        
-        if anexos_temp:
-            try:
-                # Busca o cartão
-                cartoes_encontrados = state.get("cartoes_encontrados", [])
-                if not cartoes_encontrados or index_cartao >= len(cartoes_encontrados):
-                    await update.message.reply_text("❌ Cartão não encontrado.")
-                    state["mode"] = None
-                    state["anexos"] = []
-                    user_states[user_id] = state
-                    return
+    if anexos_temp:
+        # Salva os anexos no rascunho
+        rascunhos = carregar_rascunhos(user_id)
+        if rascunhos and 0 <= index_cartao < len(rascunhos):
+            rascunho = rascunhos[index_cartao]
+            if "anexos" not in rascunho:
+                rascunho["anexos"] = []
 
-                card = cartoes_encontrados[index_cartao]
-                card_id = card["id"]
-
-                # Faz upload dos anexos para o Trello
-                anexos_adicionados = 0
-                for anexo_path in anexos_temp:
-                    try:
-                        if os.path.exists(anexo_path):
-                            logger.info(f"Tentando adicionar anexo: {anexo_path} ao cartão {card_id}")
-                            result = upload_file_to_card(user_id, card_id, anexo_path)
-                            logger.info(f"Anexo adicionado com sucesso: {anexo_path}")
-                            anexos_adicionados += 1
-                        else:
-                            logger.warning(f"Arquivo de anexo não encontrado: {anexo_path}")
-                    except Exception as e:
-                        logger.warning(f"Erro ao adicionar anexo {anexo_path}: {e}")
-
-                await update.message.reply_text(f"✅ {anexos_adicionados} anexo(s) adicionado(s) ao cartão!")
-                
-                # Limpa o estado
-                state["mode"] = None
-                state["anexos"] = []
-                user_states[user_id] = state
-                
-                # Volta para as opções de edição
-                fake_query = type('Obj', (object,), {
-                    'from_user': update.effective_user,
-                    'edit_message_text': update.message.reply_text,
-                    'message': update.message
-                })
-                await mostrar_opcoes_edicao_cartao_existente(fake_query, context, index_cartao)
-                
-            except Exception as e:
-                logger.exception(f"Erro ao adicionar anexos ao cartão existente: {e}")
-                await update.message.reply_text(f"❌ Erro ao adicionar anexos: {str(e)}")
-                state["mode"] = None
-                state["anexos"] = []
-                user_states[user_id] = state
-        else:
-            await update.message.reply_text("❌ Nenhum anexo foi enviado.")
+            rascunho["anexos"].extend(anexos_temp)
+            rascunho["editado"] = True
+            atualizar_rascunho(user_id, index_cartao, rascunho)
+
+            await update.message.reply_text(f"✅ {len(anexos_temp)} anexo(s) adicionado(s) ao cartão!")
+
+            # Limpa o estado
             state["mode"] = None
-            state["anexos"] = []
-            user_states[user_id] = state
-        
-        return
+            state["anexos"] = AnexosPendentes()  # arquivos agora pertencem ao rascunho
 
-    # Verifica se está no modo de adição de comentário para cartões existentes
-    elif state.get("mode") == "adicionando_comentario_existente":
-        index_cartao = state.get("index_cartao_existente")
-        cartoes_encontrados = state.get("cartoes_encontrados", [])
-        
-        if not cartoes_encontrados or index_cartao >= len(cartoes_encontrados):
+            # Volta para as opções de edição
+            fake_query = _MsgAsQuery(update)
+            await mostrar_opcoes_edicao(fake_query, context, index_cartao)
+        else:
             await update.message.reply_text("❌ Cartão não encontrado.")
-            state["mode"] = None
-            user_states[user_id] = state
-            return
-        
-        card = cartoes_encontrados[index_cartao]
-        card_id = card["id"]
-        
+    else:
+        await update.message.reply_text("❌ Nenhum anexo foi enviado.")
+
+    return True
+
+
+async def _texto_anexo_existente(update: Update, context: ContextTypes.DEFAULT_TYPE, state: Dict[str, Any],
+                                 text: str):
+    """Finaliza (/ok) a adição de anexos a um cartão existente (busca)"""
+    if text.lower() != "/ok":
+        return False
+
+    user_id = update.effective_user.id
+    index_cartao = state.get("index_cartao_existente")
+    anexos_temp = state.get("anexos", [])
+
+    if anexos_temp:
         try:
-            # Adiciona o comentário no Trello
-            add_comment(user_id, card_id, text)
-            
-            await update.message.reply_text("✅ Comentário adicionado com sucesso!")
-            
-            # Limpa o estado
+            # Busca o cartão
+            cartoes_encontrados = state.get("cartoes_encontrados", [])
+            if not cartoes_encontrados or index_cartao >= len(cartoes_encontrados):
+                await update.message.reply_text("❌ Cartão não encontrado.")
+                state["mode"] = None
+                _descartar_anexos(state)
+                return True
+
+            card = cartoes_encontrados[index_cartao]
+            card_id = card["id"]
+
+            # Faz upload dos anexos para o Trello
+            anexos_adicionados = 0
+            # Os arquivos foram baixados por handle_document ao entrar na lista;
+            # se algum sumiu desde então, o próprio upload acusa FileNotFoundError
+            for anexo_path in anexos_temp:
+                try:
+                    logger.debug("Tentando adicionar anexo: %s ao cartão %s", anexo_path, card_id)
+                    await upload_file_to_card(user_id, card_id, anexo_path)
+                    logger.debug("Anexo adicionado com sucesso: %s", anexo_path)
+                    anexos_adicionados += 1
+                except FileNotFoundError:
+                    logger.warning(f"Arquivo de anexo não encontrado: {anexo_path}")
+                except Exception as e:
+                    logger.warning(f"Erro ao adicionar anexo {anexo_path}: {e}")
+
+            await update.message.reply_text(f"✅ {anexos_adicionados} anexo(s) adicionado(s) ao cartão!")
+
+            # Limpa o estado (os arquivos locais já foram enviados ao Trello)
             state["mode"] = None
-            user_states[user_id] = state
-            
-            # Atualiza a interface
-            fake_query = type('Obj', (object,), {
-                'from_user': update.effective_user,
-                'edit_message_text': update.message.reply_text,
-                'message': update.message
-            })
+            _descartar_anexos(state)
+
+            # Volta para as opções de edição
+            fake_query = _MsgAsQuery(update)
             await mostrar_opcoes_edicao_cartao_existente(fake_query, context, index_cartao)
-            
+
         except Exception as e:
-            logger.exception(f"Erro ao adicionar comentário: {e}")
-            await update.message.reply_text(f"❌ Erro ao adicionar comentário: {str(e)}")
+            logger.exception(f"Erro ao adicionar anexos ao cartão existente: {e}")
+            await update.message.reply_text(f"❌ Erro ao adicionar anexos: {str(e)}")
             state["mode"] = None
-            user_states[user_id] = state
+            _descartar_anexos(state)
+    else:
+        await update.message.reply_text("❌ Nenhum anexo foi enviado.")
+        state["mode"] = None
+        _descartar_anexos(state)
 
-    # Verifica se está no modo direto de checklist
-    if state.get("mode") == "add_checklist_direto":
-        if text.startswith("/cancelar_checklist"):
-            await cancelar_cmd(update, context)
-            return
+    return True
 
-        # Processa os itens da checklist
-        index_cartao = state.get("index_cartao")
-        buffer = state.get("checklist_buffer", [])
-        buffer.append(text)
-        state["checklist_buffer"] = buffer
 
-        # Se tiver pelo menos 1 item, pergunta se quer finalizar
-        if len(buffer) >= 1:
-            itens = parse_items_from_buffer_lines(buffer)
-            mensagem = f"📋 *Itens da Checklist ({len(itens)}):*\n" + "\n".join(f"• {item}" for item in itens)
-            mensagem += "\n\nEnvie mais itens ou /finalizar_checklist para confirmar"
+async def _texto_comentario_existente(update: Update, context: ContextTypes.DEFAULT_TYPE, state: Dict[str, Any],
+                                      text: str):
+    """Adiciona o comentário enviado a um cartão existente (busca)"""
+    user_id = update.effective_user.id
+    index_cartao = state.get("index_cartao_existente")
+    cartoes_encontrados = state.get("cartoes_encontrados", [])
 
-            keyboard = [[InlineKeyboardButton("✅ Finalizar Checklist", callback_data="finalizar_checklist_agora")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+    if not cartoes_encontrados or index_cartao >= len(cartoes_encontrados):
+        await update.message.reply_text("❌ Cartão não encontrado.")
+        state["mode"] = None
+        return True
 
-            await update.message.reply_text(mensagem, parse_mode="Markdown", reply_markup=reply_markup)
+    card = cartoes_encontrados[index_cartao]
+    card_id = card["id"]
+
+    try:
+        # Adiciona o comentário no Trello
+        await add_comment(user_id, card_id, text)
+
+        await update.message.reply_text("✅ Comentário adicionado com sucesso!")
+
+        # Limpa o estado
+        state["mode"] = None
 
-        user_states[user_id] = state
+        # Atualiza a interface
+        fake_query = _MsgAsQuery(update)
+        await mostrar_opcoes_edicao_cartao_existente(fake_query, context, index_cartao)
+
+    except Exception as e:
+        logger.exception(f"Erro ao adicionar comentário: {e}")
+        await update.message.reply_text(f"❌ Erro ao adicionar comentário: {str(e)}")
+        state["mode"] = None
+
+    return True
+
+
+async def _texto_checklist_direto(update: Update, context: ContextTypes.DEFAULT_TYPE, state: Dict[str, Any],
+                                  text: str):
+    """Acumula itens no modo direto de checklist"""
+    if text.startswith("/cancelar_checklist"):
+        await cancelar_cmd(update, context)
+        return True
+
+    # Processa os itens da checklist
+    buffer = state.get("checklist_buffer", [])
+    buffer.append(text)
+    state["checklist_buffer"] = buffer
+
+    # Se tiver pelo menos 1 item, pergunta se quer finalizar
+    if len(buffer) >= 1:
+        itens = parse_items_from_buffer_lines(buffer)
+        mensagem = f"📋 *Itens da Checklist ({len(itens)}):*\n" + "\n".join(f"• {item}" for item in itens)
+        mensagem += "\n\nEnvie mais itens ou /finalizar_checklist para confirmar"
+
+        keyboard = [[InlineKeyboardButton("✅ Finalizar Checklist", callback_data="finalizar_checklist_agora")]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+
+        await update.message.reply_text(mensagem, parse_mode="Markdown", reply_markup=reply_markup)
+
+    return True
+
+
+# Modo atual do usuário -> coroutine que trata o texto recebido nesse modo
+TEXT_MODE_HANDLERS = MappingProxyType({
+    "add_checklist": _texto_checklist,
+    "add_checklist_pdf": _texto_checklist,
+    "editando_data_cartao": _texto_editar_data_cartao,
+    "adicionando_comentario_cartao": _texto_comentario_cartao,
+    "adicionando_anexo_cartao": _texto_anexo_cartao,
+    "adicionando_anexo_existente": _texto_anexo_existente,
+    "adicionando_comentario_existente": _texto_comentario_existente,
+    "add_checklist_direto": _texto_checklist_direto,
+})
+
+
+async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    text = (update.message.text or "").strip()
+    if not text:
+        return
+
+    state = await state_store.get(user_id)
+    if state.get("flow"):
+        flow = state["flow"]
+        if flow == "register_api_key":
+            state["buffer"]["api_key"] = text
+            state["flow"] = "register_token"
+            await update.message.reply_text("OK. Agora envie seu *Trello Token*:", parse_mode="Markdown")
+            return
+        elif flow == "register_token":
+            state["buffer"]["token"] = text
+            state["flow"] = "register_board"
+            await update.message.reply_text("Agora envie o *Board ID* (ID do quadro):", parse_mode="Markdown")
+            return
+        elif flow == "register_board":
+            state["buffer"]["board_id"] = text
+            buf = state["buffer"]
+            users = load_users()
+            users[str(user_id)] = {"api_key": buf.get("api_key"), "token": buf.get("token"),
+                                   "board_id": buf.get("board_id")}
+            save_users(users)
+            await state_store.set(user_id, {"mode": None})
+            await update.message.reply_text("Configuração salva ✅\n" + HELP_TEXT)
+            return
+
+    handler = TEXT_MODE_HANDLERS.get(state.get("mode"))
+    if handler and await handler(update, context, state, text):
         return
 
     # default fallback
@@ -983,10 +1882,10 @@ async def buscar_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         # Busca cartões no quadro
         board_id = users[str(user_id)]["board_id"]
-        cards = get_board_cards(user_id, board_id)
+        cards = await get_board_cards(user_id, board_id)
         
         # Busca as listas do quadro para mapear os IDs
-        lists = get_board_lists(user_id, board_id)
+        lists = await get_board_lists(user_id, board_id)
         list_map = {lst["id"]: lst["name"] for lst in lists}
 
         # Filtra cartões pelo termo de busca (case insensitive)
@@ -1003,11 +1902,17 @@ async def buscar_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
 
         # Limpa qualquer estado anterior e salva os resultados
-        user_states[user_id] = {
+        state = {
             "mode": "busca_cartoes",
             "cartoes_encontrados": cartoes_encontrados,
-            "termo_busca": termo_busca
+            "termo_busca": termo_busca,
+            "detail_cache": {}
         }
+        await state_store.set(user_id, state)
+
+        # Pré-carrega os primeiros cartões enquanto o usuário lê os resultados
+        for card in cartoes_encontrados[:PREFETCH_CARDS]:
+            _spawn(_prefetch_detail(user_id, card["id"], state["detail_cache"]))
 
         # Mostra resultados com interface de edição
         await mostrar_resultados_busca(update, context, cartoes_encontrados, termo_busca)
@@ -1017,6 +1922,15 @@ async def buscar_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"❌ Erro ao buscar cartões: {str(e)}")
 
 
+async def _prefetch_detail(user_id: int, card_id: str, cache: Dict[str, Any]):
+    """Busca os detalhes de um cartão em segundo plano e guarda em cache"""
+    try:
+        detalhes = await get_card_full(user_id, card_id)
+        cache[card_id] = (time.monotonic(), detalhes)
+    except Exception as e:
+        logger.warning(f"Erro ao pré-carregar cartão {card_id}: {e}")
+
+
 async def mostrar_resultados_busca(update: Update, context: ContextTypes.DEFAULT_TYPE,
                                    cartoes_encontrados: List[Dict], termo_busca: str):
     """Mostra resultados da busca com interface de edição"""
@@ -1028,9 +1942,7 @@ async def mostrar_resultados_busca(update: Update, context: ContextTypes.DEFAULT
         lista_nome = card.get("list_name", "Lista desconhecida")
         
         # Limita o tamanho do nome do cartão para evitar problemas
-        nome_cartao = card['name']
-        if len(nome_cartao) > 100:
-            nome_cartao = nome_cartao[:97] + "..."
+        nome_cartao = _short(card['name'], 100)
         
         # Escapa caracteres especiais do Markdown
         nome_cartao = nome_cartao.replace('*', '\\*').replace('_', '\\_').replace('`', '\\`')
@@ -1041,14 +1953,10 @@ async def mostrar_resultados_busca(update: Update, context: ContextTypes.DEFAULT
 
         # Informações adicionais
         if card.get("due"):
-            try:
-                data_entrega = datetime.fromisoformat(card["due"].replace('Z', '+00:00')).strftime("%d/%m/%Y")
-                texto_resultado += f"📅 Data: {data_entrega}\n"
-            except Exception:
-                pass
+            texto_resultado += f"📅 Data: {fmt_due(card['due'])}\n"
 
         if card.get("desc"):
-            desc_curta = card["desc"][:50] + "..." if len(card["desc"]) > 50 else card["desc"]
+            desc_curta = _short(card["desc"], 53)
             # Escapa caracteres especiais na descrição também
             desc_curta = desc_curta.replace('*', '\\*').replace('_', '\\_').replace('`', '\\`')
             texto_resultado += f"📝 Descrição: {desc_curta}\n"
@@ -1069,9 +1977,7 @@ async def mostrar_resultados_busca(update: Update, context: ContextTypes.DEFAULT
     
     for i in range(max_cards_to_show):
         card = cartoes_encontrados[i]
-        nome_curto = card['name']
-        if len(nome_curto) > 30:
-            nome_curto = nome_curto[:27] + "..."
+        nome_curto = _short(card['name'])
 
         keyboard.append([InlineKeyboardButton(f"📝 {i + 1}. {nome_curto}",
                                               callback_data=f"editar_cartao_busca|{i}")])
@@ -1085,19 +1991,8 @@ async def mostrar_resultados_busca(update: Update, context: ContextTypes.DEFAULT
 
     reply_markup = InlineKeyboardMarkup(keyboard)
 
-    # Divide a mensagem se for muito longa
-    if len(texto_resultado) > 4000:
-        partes = chunk_text(texto_resultado, 4000)
-        await update.message.reply_text(partes[0], parse_mode="Markdown")
-        
-        # Para as partes restantes, não usa Markdown para evitar problemas
-        for parte in partes[1:]:
-            await update.message.reply_text(parte)
-        
-        # Envia os botões separadamente
-        await update.message.reply_text("Selecione um cartão para editar:", reply_markup=reply_markup)
-    else:
-        await update.message.reply_text(texto_resultado, parse_mode="Markdown", reply_markup=reply_markup)
+    await update.message.reply_text(limitar_mensagem(texto_resultado), parse_mode="Markdown",
+                                    reply_markup=reply_markup)
 
 
 async def mostrar_resultados_busca_from_callback(query, context, cartoes_encontrados: List[Dict], termo_busca: str):
@@ -1110,9 +2005,7 @@ async def mostrar_resultados_busca_from_callback(query, context, cartoes_encontr
         lista_nome = card.get("list_name", "Lista desconhecida")
         
         # Limita o tamanho do nome do cartão para evitar problemas
-        nome_cartao = card['name']
-        if len(nome_cartao) > 100:
-            nome_cartao = nome_cartao[:97] + "..."
+        nome_cartao = _short(card['name'], 100)
         
         # Escapa caracteres especiais do Markdown
         nome_cartao = nome_cartao.replace('*', '\\*').replace('_', '\\_').replace('`', '\\`')
@@ -1123,14 +2016,10 @@ async def mostrar_resultados_busca_from_callback(query, context, cartoes_encontr
 
         # Informações adicionais
         if card.get("due"):
-            try:
-                data_entrega = datetime.fromisoformat(card["due"].replace('Z', '+00:00')).strftime("%d/%m/%Y")
-                texto_resultado += f"📅 Data: {data_entrega}\n"
-            except Exception:
-                pass
+            texto_resultado += f"📅 Data: {fmt_due(card['due'])}\n"
 
         if card.get("desc"):
-            desc_curta = card["desc"][:50] + "..." if len(card["desc"]) > 50 else card["desc"]
+            desc_curta = _short(card["desc"], 53)
             # Escapa caracteres especiais na descrição também
             desc_curta = desc_curta.replace('*', '\\*').replace('_', '\\_').replace('`', '\\`')
             texto_resultado += f"📝 Descrição: {desc_curta}\n"
@@ -1151,9 +2040,7 @@ async def mostrar_resultados_busca_from_callback(query, context, cartoes_encontr
     
     for i in range(max_cards_to_show):
         card = cartoes_encontrados[i]
-        nome_curto = card['name']
-        if len(nome_curto) > 30:
-            nome_curto = nome_curto[:27] + "..."
+        nome_curto = _short(card['name'])
 
         keyboard.append([InlineKeyboardButton(f"📝 {i + 1}. {nome_curto}",
                                               callback_data=f"editar_cartao_busca|{i}")])
@@ -1167,25 +2054,14 @@ async def mostrar_resultados_busca_from_callback(query, context, cartoes_encontr
 
     reply_markup = InlineKeyboardMarkup(keyboard)
 
-    # Divide a mensagem se for muito longa
-    if len(texto_resultado) > 4000:
-        partes = chunk_text(texto_resultado, 4000)
-        await query.edit_message_text(partes[0], parse_mode="Markdown")
-        
-        # Para as partes restantes, não usa Markdown para evitar problemas
-        for parte in partes[1:]:
-            await query.message.reply_text(parte)
-        
-        # Envia os botões separadamente
-        await query.message.reply_text("Selecione um cartão para editar:", reply_markup=reply_markup)
-    else:
-        try:
-            await query.edit_message_text(texto_resultado, parse_mode="Markdown", reply_markup=reply_markup)
-        except BadRequest as e:
-            if "Message is not modified" in str(e):
-                await query.answer("✅ Resultados atualizados")
-            else:
-                raise e
+    try:
+        await query.edit_message_text(limitar_mensagem(texto_resultado), parse_mode="Markdown",
+                                      reply_markup=reply_markup)
+    except BadRequest as e:
+        if "Message is not modified" in str(e):
+            await query.answer("✅ Resultados atualizados")
+        else:
+            raise e
 
 
 async def handle_busca_paginada(update: Update, context: ContextTypes.DEFAULT_TYPE, pagina: int, termo_busca: str):
@@ -1194,7 +2070,7 @@ async def handle_busca_paginada(update: Update, context: ContextTypes.DEFAULT_TY
     await query.answer()
 
     user_id = query.from_user.id
-    state = user_states.get(user_id, {})
+    state = await state_store.get(user_id)
     cartoes_encontrados = state.get("cartoes_encontrados", [])
 
     if not cartoes_encontrados:
@@ -1212,9 +2088,7 @@ async def handle_busca_paginada(update: Update, context: ContextTypes.DEFAULT_TY
         lista_nome = card.get("list_name", "Lista desconhecida")
         
         # Limita o tamanho do nome do cartão para evitar problemas
-        nome_cartao = card['name']
-        if len(nome_cartao) > 100:
-            nome_cartao = nome_cartao[:97] + "..."
+        nome_cartao = _short(card['name'], 100)
         
         # Escapa caracteres especiais do Markdown
         nome_cartao = nome_cartao.replace('*', '\\*').replace('_', '\\_').replace('`', '\\`')
@@ -1225,14 +2099,10 @@ async def handle_busca_paginada(update: Update, context: ContextTypes.DEFAULT_TY
 
         # Informações adicionais
         if card.get("due"):
-            try:
-                data_entrega = datetime.fromisoformat(card["due"].replace('Z', '+00:00')).strftime("%d/%m/%Y")
-                texto_resultado += f"📅 Data: {data_entrega}\n"
-            except Exception:
-                pass
+            texto_resultado += f"📅 Data: {fmt_due(card['due'])}\n"
 
         if card.get("desc"):
-            desc_curta = card["desc"][:50] + "..." if len(card["desc"]) > 50 else card["desc"]
+            desc_curta = _short(card["desc"], 53)
             # Escapa caracteres especiais na descrição também
             desc_curta = desc_curta.replace('*', '\\*').replace('_', '\\_').replace('`', '\\`')
             texto_resultado += f"📝 Descrição: {desc_curta}\n"
@@ -1247,9 +2117,7 @@ async def handle_busca_paginada(update: Update, context: ContextTypes.DEFAULT_TY
     for i in range(len(cartoes_pagina)):
         card_index = start_index + i
         card = cartoes_pagina[i]
-        nome_curto = card['name']
-        if len(nome_curto) > 30:
-            nome_curto = nome_curto[:27] + "..."
+        nome_curto = _short(card['name'])
 
         keyboard.append([InlineKeyboardButton(f"📝 {card_index + 1}. {nome_curto}",
                                               callback_data=f"editar_cartao_busca|{card_index}")])
@@ -1281,7 +2149,7 @@ async def handle_busca_paginada(update: Update, context: ContextTypes.DEFAULT_TY
 async def mostrar_opcoes_edicao_cartao_existente(query, context, index_cartao: int):
     """Mostra opções de edição para um cartão existente (da busca) - SIMPLIFICADA"""
     user_id = query.from_user.id
-    state = user_states.get(user_id, {})
+    state = await state_store.get(user_id)
     cartoes_encontrados = state.get("cartoes_encontrados", [])
 
     if not cartoes_encontrados or index_cartao >= len(cartoes_encontrados):
@@ -1290,19 +2158,25 @@ async def mostrar_opcoes_edicao_cartao_existente(query, context, index_cartao: i
 
     card = cartoes_encontrados[index_cartao]
     card_id = card["id"]
+    editar = query.edit_message_text
 
     try:
-        # Busca informações atualizadas do cartão
-        card_detalhes = get_card_by_id(user_id, card_id)
-        checklists = get_card_checklists(user_id, card_id)
-        comentarios = get_card_comments(user_id, card_id)
-        anexos = get_card_attachments(user_id, card_id)
-        
-        # Busca membros do cartão
-        membros_card = trello_request_for_user(user_id, "GET", f"/cards/{card_id}/members")
-        
-        # Busca etiquetas do cartão
-        etiquetas_card = trello_request_for_user(user_id, "GET", f"/cards/{card_id}/labels")
+        # Usa os detalhes pré-carregados pela busca, se ainda estiverem frescos
+        prefetch = state.get("detail_cache", {}).pop(card_id, None)
+        if prefetch and time.monotonic() - prefetch[0] < DETAIL_CACHE_TTL:
+            card_detalhes = prefetch[1]
+        else:
+            # Mostra um aviso imediato e só depois espera pelo Trello
+            aviso = await query.edit_message_text("⏳ Carregando cartão...")
+            if isinstance(aviso, Message):
+                editar = aviso.edit_text
+            card_detalhes = await get_card_full(user_id, card_id)
+
+        checklists = card_detalhes.get("checklists", [])
+        comentarios = card_detalhes.get("actions", [])
+        anexos = card_detalhes.get("attachments", [])
+        membros_card = card_detalhes.get("members", [])
+        etiquetas_card = card_detalhes.get("labels", [])
 
         # Detalhes do cartão
         detalhes_text = f"*EDITANDO CARTÃO:*\n\n"
@@ -1318,7 +2192,7 @@ async def mostrar_opcoes_edicao_cartao_existente(query, context, index_cartao: i
 
         # Data
         if card_detalhes.get('due'):
-            data_entrega = datetime.fromisoformat(card_detalhes['due'].replace('Z', '+00:00')).strftime("%d/%m/%Y")
+            data_entrega = fmt_due(card_detalhes['due'])
             detalhes_text += f"📅 *Data entrega:* {data_entrega}\n\n"
 
         # Membros (se houver)
@@ -1345,9 +2219,7 @@ async def mostrar_opcoes_edicao_cartao_existente(query, context, index_cartao: i
         if comentarios:
             detalhes_text += f"💬 *Comentários ({len(comentarios)}):*\n"
             for comentario in comentarios[:3]:  # Mostra apenas os 3 primeiros
-                texto_comentario = comentario['data']['text']
-                if len(texto_comentario) > 50:
-                    texto_comentario = texto_comentario[:47] + "..."
+                texto_comentario = _short(comentario['data']['text'], 50)
                 detalhes_text += f"• {texto_comentario}\n"
             detalhes_text += "\n"
 
@@ -1355,9 +2227,7 @@ async def mostrar_opcoes_edicao_cartao_existente(query, context, index_cartao: i
         if anexos:
             detalhes_text += f"📎 *Anexos ({len(anexos)}):*\n"
             for anexo in anexos[:3]:  # Mostra apenas os 3 primeiros
-                nome_anexo = anexo.get('name', 'Arquivo')
-                if len(nome_anexo) > 30:
-                    nome_anexo = nome_anexo[:27] + "..."
+                nome_anexo = _short(anexo.get('name', 'Arquivo'))
                 detalhes_text += f"• {nome_anexo}\n"
             detalhes_text += "\n"
 
@@ -1376,17 +2246,17 @@ async def mostrar_opcoes_edicao_cartao_existente(query, context, index_cartao: i
             # Última linha: Navegação
             [
                 InlineKeyboardButton("⬅️ Voltar", callback_data="voltar_busca"),
-                InlineKeyboardButton("🔄 Atualizar", callback_data=f"editar_cartao_busca|{index_cartao}")
+                InlineKeyboardButton("🔄 Atualizar", callback_data=f"atualizar_cartao_busca|{index_cartao}")
             ]
         ]
 
         reply_markup = InlineKeyboardMarkup(keyboard)
 
-        await query.edit_message_text(detalhes_text, parse_mode="Markdown", reply_markup=reply_markup)
+        await editar(detalhes_text, parse_mode="Markdown", reply_markup=reply_markup)
 
     except Exception as e:
         logger.exception(f"Erro ao carregar detalhes do cartão: {e}")
-        await query.edit_message_text(f"❌ Erro ao carregar detalhes do cartão: {str(e)}")
+        await editar(f"❌ Erro ao carregar detalhes do cartão: {str(e)}")
 
 
 async def ver_anexos_existente(update: Update, context: ContextTypes.DEFAULT_TYPE, index_cartao: int):
@@ -1395,7 +2265,7 @@ async def ver_anexos_existente(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
     
     user_id = query.from_user.id
-    state = user_states.get(user_id, {})
+    state = await state_store.get(user_id)
     cartoes_encontrados = state.get("cartoes_encontrados", [])
 
     if not cartoes_encontrados or index_cartao >= len(cartoes_encontrados):
@@ -1407,7 +2277,7 @@ async def ver_anexos_existente(update: Update, context: ContextTypes.DEFAULT_TYP
 
     try:
         # Busca anexos do cartão
-        anexos = get_card_attachments(user_id, card_id)
+        anexos = await get_card_attachments(user_id, card_id)
         
         if not anexos:
             mensagem = f"📎 *Anexos do cartão:*\n\n*{card['name']}*\n\nNenhum anexo encontrado."
@@ -1427,15 +2297,7 @@ async def ver_anexos_existente(update: Update, context: ContextTypes.DEFAULT_TYP
             tamanho = anexo.get('bytes', 0)
             
             # Formata o tamanho do arquivo
-            if tamanho > 0:
-                if tamanho < 1024:
-                    tamanho_str = f"{tamanho} B"
-                elif tamanho < 1024 * 1024:
-                    tamanho_str = f"{tamanho/1024:.1f} KB"
-                else:
-                    tamanho_str = f"{tamanho/(1024*1024):.1f} MB"
-            else:
-                tamanho_str = "Tamanho desconhecido"
+            tamanho_str = fmt_size(tamanho) if tamanho > 0 else "Tamanho desconhecido"
             
             mensagem += f"{i}. [{nome_anexo}]({url_anexo}) - {tamanho_str}\n"
 
@@ -1459,51 +2321,17 @@ async def ver_anexos_existente(update: Update, context: ContextTypes.DEFAULT_TYP
 
 async def add_anexo_existente(update: Update, context: ContextTypes.DEFAULT_TYPE, index_cartao: int):
     """Inicia modo de adição de anexo para um cartão existente - ACEITA QUALQUER TIPO DE ARQUIVO"""
-    query = update.callback_query
-    await query.answer()
-    
-    user_id = query.from_user.id
-    state = user_states.get(user_id, {})
-    
-    # Entra no modo de adição de anexo
-    state.update({
-        "mode": "adicionando_anexo_existente",
-        "index_cartao_existente": index_cartao,
-        "anexos": []
-    })
-    user_states[user_id] = state
-    
-    await query.edit_message_text(
-        "📎 *Modo de adição de anexos*\n\n"
-        "Agora envie os arquivos que deseja anexar ao cartão.\n"
-        "✅ *Aceita qualquer tipo de arquivo:* imagens, PDFs, documentos, etc.\n\n"
-        "Após enviar todos os arquivos, use:\n"
-        "• `/ok` para finalizar e adicionar os anexos\n"
-        "• `/cancelar` para cancelar a operação\n\n"
-        "Ou clique no botão abaixo para finalizar:",
-        parse_mode="Markdown"
+    await enter_mode(
+        update, mode="adicionando_anexo_existente", index=index_cartao, index_key="index_cartao_existente",
+        extra_state={"anexos": AnexosPendentes()}, editar=True, prompt=PROMPTS["anexo_existente"],
     )
 
 
 async def add_comentario_existente(update: Update, context: ContextTypes.DEFAULT_TYPE, index_cartao: int):
     """Inicia modo de adição de comentário para um cartão existente"""
-    query = update.callback_query
-    await query.answer()
-    
-    user_id = query.from_user.id
-    state = user_states.get(user_id, {})
-    
-    # Entra no modo de adição de comentário
-    state.update({
-        "mode": "adicionando_comentario_existente",
-        "index_cartao_existente": index_cartao
-    })
-    user_states[user_id] = state
-    
-    await query.edit_message_text(
-        "💬 *Modo de adição de comentário*\n\n"
-        "Por favor, envie o comentário que deseja adicionar ao cartão:",
-        parse_mode="Markdown"
+    await enter_mode(
+        update, mode="adicionando_comentario_existente", index=index_cartao, index_key="index_cartao_existente",
+        editar=True, prompt=PROMPTS["comentario_existente"],
     )
 
 
@@ -1513,7 +2341,7 @@ async def mover_cartao_existente(update: Update, context: ContextTypes.DEFAULT_T
     await query.answer()
     
     user_id = query.from_user.id
-    state = user_states.get(user_id, {})
+    state = await state_store.get(user_id)
     cartoes_encontrados = state.get("cartoes_encontrados", [])
 
     if not cartoes_encontrados or index_cartao >= len(cartoes_encontrados):
@@ -1526,15 +2354,16 @@ async def mover_cartao_existente(update: Update, context: ContextTypes.DEFAULT_T
         users = load_users()
         board_id = users[str(user_id)]["board_id"]
         
-        # Busca listas disponíveis no quadro
-        lists = get_board_lists(user_id, board_id)
+        # Listas do quadro e lista atual do cartão (pode ter mudado desde a busca) em uma só requisição
+        lists, lista_atual = await trello_batch(user_id, [board_lists_path(board_id), f"/cards/{card['id']}/list?fields=name"])
+        guardar_dados_quadro("lists", user_id, board_id, lists)
         
         if not lists:
             await query.edit_message_text("❌ Nenhuma lista encontrada no quadro.")
             return
 
         # Lista atual do cartão
-        lista_atual_id = card.get("idList")
+        lista_atual_id = card["idList"] = lista_atual.get("id")
         lista_atual_nome = "Lista desconhecida"
         
         # Cria teclado com listas disponíveis
@@ -1546,7 +2375,7 @@ async def mover_cartao_existente(update: Update, context: ContextTypes.DEFAULT_T
                 lista_atual_nome = lista_nome
                 lista_nome = f"📍 {lista_nome} (atual)"
             
-            keyboard.append([InlineKeyboardButton(lista_nome, callback_data=f"mover_para_lista|{index_cartao}|{lst['id']}")])
+            keyboard.append([InlineKeyboardButton(lista_nome, callback_data=callback_data("ml", index_cartao, lst['id']))])
 
         keyboard.append([InlineKeyboardButton("⬅️ Voltar", callback_data=f"editar_cartao_busca|{index_cartao}")])
 
@@ -1567,7 +2396,7 @@ async def mover_para_lista_handler(update: Update, context: ContextTypes.DEFAULT
     await query.answer()
     
     user_id = query.from_user.id
-    state = user_states.get(user_id, {})
+    state = await state_store.get(user_id)
     cartoes_encontrados = state.get("cartoes_encontrados", [])
 
     if not cartoes_encontrados or index_cartao >= len(cartoes_encontrados):
@@ -1579,12 +2408,13 @@ async def mover_para_lista_handler(update: Update, context: ContextTypes.DEFAULT
 
     try:
         # Move o cartão
-        result = trello_request_for_user(user_id, "PUT", f"/cards/{card_id}", params={"idList": lista_id})
+        await trello_request_for_user(user_id, "PUT", f"/cards/{card_id}", params={"idList": lista_id})
+        card["idList"] = lista_id
         
-        # Busca o nome da lista de destino
+        # Busca o nome da lista de destino (já carregada ao montar o teclado)
         users = load_users()
         board_id = users[str(user_id)]["board_id"]
-        lists = get_board_lists(user_id, board_id)
+        lists = await get_board_lists_cached(user_id, board_id)
         lista_destino_nome = "Lista desconhecida"
         
         for lst in lists:
@@ -1619,16 +2449,17 @@ async def pdf_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Configure suas credenciais primeiro com /start.")
         return
 
-    # Limpa rascunhos anteriores
+    # Limpa rascunhos anteriores (e PDFs da sessão anterior ainda em processamento)
+    cancelar_lotes_pdf(user_id)
     limpar_rascunhos(user_id)
 
     # Entra em modo de coleta de PDFs
-    state = user_states.get(user_id, {})
+    state = await state_store.get(user_id)
     state.update({
         "mode": "coletando_pdfs",
         "arquivos_temp": []  # Apenas para armazenar caminhos dos PDFs originais
     })
-    user_states[user_id] = state
+    await state_store.set(user_id, state)
 
     await update.message.reply_text(
         "📄 *Modo de criação de cartões por PDF ativado!*\n\n"
@@ -1641,59 +2472,63 @@ async def pdf_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
-async def ok_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Mostra prévia dos cartões no formato específico com botões de edição"""
-    user_id = update.effective_user.id
+# emoji exibido para cada cor de etiqueta do Trello
+COLOR_EMOJI = {
+    'green': '🟢', 'yellow': '🟡', 'orange': '🟠', 'red': '🔴',
+    'purple': '🟣', 'blue': '🔵', 'sky': '💠', 'lime': '🍏',
+    'pink': '🌸', 'black': '⚫'
+}
 
-    # Carrega rascunhos
-    rascunhos = carregar_rascunhos(user_id)
+PREVIEW_HEADER = "📋 *PRÉVIA DOS CARTÕES - CLIQUE PARA EDITAR:*\n\n"
+PREVIEW_SEPARATOR = "\n━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
+PREVIEW_FOOTER = "Clique nos botões abaixo para editar cada cartão individualmente."
 
-    if not rascunhos:
-        await update.message.reply_text("Nenhum PDF foi processado ainda. Envie os arquivos PDF primeiro.")
-        return
 
-    # Mensagem de prévia
-    preview_text = "📋 *PRÉVIA DOS CARTÕES - CLIQUE PARA EDITAR:*\n\n"
+@functools.lru_cache(maxsize=64)
+def _build_preview_cached(rascunhos_json: bytes):
+    rascunhos = orjson.loads(rascunhos_json)
+
+    # Mensagem de prévia (montada em partes e unida no final)
+    parts = [PREVIEW_HEADER]
 
     for i, rascunho in enumerate(rascunhos):
         status_editado = " ✏️" if rascunho.get("editado", False) else ""
-        preview_text += f"*Cartão {i + 1}:*{status_editado}\n"
-        preview_text += f"*{rascunho['titulo']}*\n"
+        parts.append(f"*Cartão {i + 1}:*{status_editado}\n")
+        parts.append(f"*{rascunho['titulo']}*\n")
 
         # Mostra primeiros produtos (máximo 2)
-        produtos_preview = rascunho.get('produtos', [])[:2]
-        if produtos_preview:
-            preview_text += "\n".join(produtos_preview)
-            if len(rascunho.get('produtos', [])) > 2:
-                preview_text += f"\n... +{len(rascunho.get('produtos', [])) - 2} produtos"
+        produtos = rascunho.get('produtos', [])
+        if produtos:
+            parts.append("\n".join(produtos[:2]))
+            if len(produtos) > 2:
+                parts.append(f"\n... +{len(produtos) - 2} produtos")
 
-        preview_text += f"\n\n{rascunho['data_formatada']}"
+        parts.append(f"\n\n{rascunho['data_formatada']}")
 
         # Informações adicionais se houver
         if rascunho.get('checklists'):
-            preview_text += f"\n📋 {len(rascunho['checklists'])} checklist(s)"
+            parts.append(f"\n📋 {len(rascunho['checklists'])} checklist(s)")
         if rascunho.get('comentarios'):
-            preview_text += f"\n💬 Comentário adicionado"
+            parts.append("\n💬 Comentário adicionado")
         if rascunho.get('membros'):
-            preview_text += f"\n👥 {len(rascunho['membros'])} membro(s)"
+            parts.append(f"\n👥 {len(rascunho['membros'])} membro(s)")
         if rascunho.get('etiquetas'):
-            preview_text += f"\n🏷️ {len(rascunho['etiquetas'])} etiqueta(s)"
+            parts.append(f"\n🏷️ {len(rascunho['etiquetas'])} etiqueta(s)")
         if rascunho.get('anexos'):
-            preview_text += f"\n📎 {len(rascunho['anexos'])} anexo(s)"
+            parts.append(f"\n📎 {len(rascunho['anexos'])} anexo(s)")
 
-        preview_text += "\n━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
+        parts.append(PREVIEW_SEPARATOR)
 
-    preview_text += f"📊 *Total: {len(rascunhos)} cartões*\n\n"
-    preview_text += "Clique nos botões abaixo para editar cada cartão individualmente."
+    parts.append(f"📊 *Total: {len(rascunhos)} cartões*\n\n")
+    parts.append(PREVIEW_FOOTER)
+    preview_text = "".join(parts)
 
     # Cria botões para cada cartão
     keyboard = []
     for i in range(len(rascunhos)):
         rascunho = rascunhos[i]
         # Nome curto: "38379 | IGREJA BATISTA..."
-        titulo_curto = rascunho['titulo']
-        if len(titulo_curto) > 30:
-            titulo_curto = titulo_curto[:27] + "..."
+        titulo_curto = _short(rascunho['titulo'])
 
         status_editado = " ✏️" if rascunho.get("editado", False) else ""
         keyboard.append([InlineKeyboardButton(f"📝 Cartão {i + 1}: {titulo_curto}{status_editado}",
@@ -1705,84 +2540,46 @@ async def ok_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         InlineKeyboardButton("🚀 Criar Todos", callback_data="criar_todos_cartoes")
     ])
 
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    return preview_text, InlineKeyboardMarkup(keyboard)
 
-    await update.message.reply_text(preview_text, parse_mode="Markdown", reply_markup=reply_markup)
 
+def build_preview(rascunhos: List[Dict[str, Any]]):
+    """Monta (texto, teclado) da prévia dos cartões; rascunhos iguais reaproveitam o resultado"""
+    return _build_preview_cached(orjson.dumps(rascunhos))
 
-async def ok_cmd_from_callback(query, context):
-    """Versão do ok_cmd para ser chamada via callback"""
-    user_id = query.from_user.id
 
-    # Carrega rascunhos
+async def ok_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Mostra prévia dos cartões no formato específico com botões de edição"""
+    user_id = update.effective_user.id
+
+    # Carrega rascunhos (depois dos PDFs que ainda estão sendo processados)
+    await concluir_lotes_pdf(user_id)
     rascunhos = carregar_rascunhos(user_id)
 
     if not rascunhos:
-        await query.edit_message_text("Nenhum PDF foi processado ainda. Envie os arquivos PDF primeiro.")
+        await update.message.reply_text("Nenhum PDF foi processado ainda. Envie os arquivos PDF primeiro.")
         return
 
-    # Mensagem de prévia
-    preview_text = "📋 *PRÉVIA DOS CARTÕES - CLIQUE PARA EDITAR:*\n\n"
-
-    for i, rascunho in enumerate(rascunhos):
-        status_editado = " ✏️" if rascunho.get("editado", False) else ""
-        preview_text += f"*Cartão {i + 1}:*{status_editado}\n"
-        preview_text += f"*{rascunho['titulo']}*\n"
-
-        # Mostra primeiros produtos (máximo 2)
-        produtos_preview = rascunho.get('produtos', [])[:2]
-        if produtos_preview:
-            preview_text += "\n".join(produtos_preview)
-            if len(rascunho.get('produtos', [])) > 2:
-                preview_text += f"\n... +{len(rascunho.get('produtos', [])) - 2} produtos"
-
-        preview_text += f"\n\n{rascunho['data_formatada']}"
-
-        # Informações adicionais se houver
-        if rascunho.get('checklists'):
-            preview_text += f"\n📋 {len(rascunho['checklists'])} checklist(s)"
-        if rascunho.get('comentarios'):
-            preview_text += f"\n💬 Comentário adicionado"
-        if rascunho.get('membros'):
-            preview_text += f"\n👥 {len(rascunho['membros'])} membro(s)"
-        if rascunho.get('etiquetas'):
-            preview_text += f"\n🏷️ {len(rascunho['etiquetas'])} etiqueta(s)"
-        if rascunho.get('anexos'):
-            preview_text += f"\n📎 {len(rascunho['anexos'])} anexo(s)"
+    preview_text, reply_markup = build_preview(rascunhos)
 
-        preview_text += "\n━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
+    await update.message.reply_text(preview_text, parse_mode="Markdown", reply_markup=reply_markup)
 
-    preview_text += f"📊 *Total: {len(rascunhos)} cartões*\n\n"
-    preview_text += "Clique nos botões abaixo para editar cada cartão individualmente."
 
-    # Cria botões para cada cartão
-    keyboard = []
-    for i in range(len(rascunhos)):
-        rascunho = rascunhos[i]
-        # Nome curto: "38379 | IGREJA BATISTA..."
-        titulo_curto = rascunho['titulo']
-        if len(titulo_curto) > 30:
-            titulo_curto = titulo_curto[:27] + "..."
+async def ok_cmd_from_callback(query, context):
+    """Versão do ok_cmd para ser chamada via callback"""
+    user_id = query.from_user.id
 
-        status_editado = " ✏️" if rascunho.get("editado", False) else ""
-        keyboard.append([InlineKeyboardButton(f"📝 Cartão {i + 1}: {titulo_curto}{status_editado}",
-                                              callback_data=f"editar_cartao|{i}")])
+    # Carrega rascunhos (depois dos PDFs que ainda estão sendo processados)
+    await concluir_lotes_pdf(user_id)
+    rascunhos = carregar_rascunhos(user_id)
 
-    # Botões de ação global
-    keyboard.append([
-        InlineKeyboardButton("🔄 Atualizar Prévia", callback_data="atualizar_previa"),
-        InlineKeyboardButton("🚀 Criar Todos", callback_data="criar_todos_cartoes")
-    ])
+    if not rascunhos:
+        await query.edit_message_text("Nenhum PDF foi processado ainda. Envie os arquivos PDF primeiro.")
+        return
 
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    preview_text, reply_markup = build_preview(rascunhos)
 
-    try:
-        await query.edit_message_text(preview_text, parse_mode="Markdown", reply_markup=reply_markup)
-    except BadRequest as e:
-        if "Message is not modified" in str(e):
-            await query.answer("✅ Prévia atualizada")
-        else:
-            raise e
+    await editar_render(query, context, preview_text, reply_markup, "✅ Prévia atualizada")
 
 
 async def mostrar_opcoes_edicao(query, context, index_cartao: int):
@@ -1797,46 +2594,47 @@ async def mostrar_opcoes_edicao(query, context, index_cartao: int):
     rascunho = rascunhos[index_cartao]
 
     # Detalhes do cartão NO FORMATO ESPECÍFICO
-    detalhes_text = f"*EDITANDO CARTÃO {index_cartao + 1}:*\n\n"
-    detalhes_text += f"*{rascunho['titulo']}*\n\n"
+    parts = [f"*EDITANDO CARTÃO {index_cartao + 1}:*\n\n", f"*{rascunho['titulo']}*\n\n"]
 
     # Produtos
     if rascunho.get('produtos'):
-        detalhes_text += "\n".join(rascunho['produtos']) + "\n\n"
+        parts.append("\n".join(rascunho['produtos']))
+        parts.append("\n\n")
 
     # Observações
     if rascunho.get('observacoes') and rascunho['observacoes'] != "N/A":
-        detalhes_text += f"{rascunho['observacoes']}\n\n"
+        parts.append(f"{rascunho['observacoes']}\n\n")
 
     # Data
-    detalhes_text += f"{rascunho['data_formatada']}\n\n"
+    parts.append(f"{rascunho['data_formatada']}\n\n")
 
     # Informações adicionais
     if rascunho.get('checklists'):
-        detalhes_text += f"📋 *Checklists Adicionadas:*\n"
+        parts.append("📋 *Checklists Adicionadas:*\n")
         for checklist in rascunho['checklists']:
             if isinstance(checklist, dict):
                 # Nova estrutura com itens
-                detalhes_text += f"• {checklist['nome']} ({len(checklist.get('itens', []))} itens)\n"
+                parts.append(f"• {checklist['nome']} ({len(checklist.get('itens', []))} itens)\n")
                 for item in checklist.get('itens', []):
-                    detalhes_text += f"  ◦ {item}\n"
+                    parts.append(f"  ◦ {item}\n")
             else:
                 # Estrutura antiga (apenas nome)
-                detalhes_text += f"• {checklist}\n"
-        detalhes_text += "\n"
+                parts.append(f"• {checklist}\n")
+        parts.append("\n")
 
     if rascunho.get('comentarios'):
-        detalhes_text += f"💬 *Comentários:*\n{rascunho['comentarios']}\n\n"
+        parts.append(f"💬 *Comentários:*\n{rascunho['comentarios']}\n\n")
     if rascunho.get('membros'):
-        detalhes_text += f"👥 *Membros:* {', '.join(rascunho['membros'])}\n\n"
+        parts.append(f"👥 *Membros:* {', '.join(rascunho['membros'])}\n\n")
     if rascunho.get('etiquetas'):
-        detalhes_text += f"🏷️ *Etiquetas:* {', '.join(rascunho['etiquetas'])}\n\n"
+        parts.append(f"🏷️ *Etiquetas:* {', '.join(rascunho['etiquetas'])}\n\n")
     if rascunho.get('anexos'):
-        detalhes_text += f"📎 *Anexos ({len(rascunho['anexos'])}):*\n"
+        parts.append(f"📎 *Anexos ({len(rascunho['anexos'])}):*\n")
         for anexo in rascunho['anexos']:
-            nome_arquivo = os.path.basename(anexo)
-            detalhes_text += f"• {nome_arquivo}\n"
-        detalhes_text += "\n"
+            parts.append(f"• {os.path.basename(anexo)}\n")
+        parts.append("\n")
+
+    detalhes_text = "".join(parts)
 
     # Botões de edição
     keyboard = [
@@ -1855,82 +2653,33 @@ async def mostrar_opcoes_edicao(query, context, index_cartao: int):
     reply_markup = InlineKeyboardMarkup(keyboard)
 
     try:
-        await query.edit_message_text(detalhes_text, parse_mode="Markdown", reply_markup=reply_markup)
+        await editar_render(query, context, detalhes_text, reply_markup)
     except Exception as e:
         await query.message.reply_text(detalhes_text, parse_mode="Markdown", reply_markup=reply_markup)
 
 
 async def editar_data_cartao(update: Update, context: ContextTypes.DEFAULT_TYPE, index_cartao: int):
     """Inicia modo de edição de data para um cartão específico"""
-    user_id = update.effective_user.id if update.message else update.callback_query.from_user.id
-
-    state = user_states.get(user_id, {})
-    state.update({
-        "mode": "editando_data_cartao",
-        "index_cartao": index_cartao,
-        "buffer": []
-    })
-    user_states[user_id] = state
-
-    mensagem = "📅 *Modo de edição de data*\n\nEnvie a nova data no formato dd/mm/aaaa:"
-
-    if update.callback_query:
-        await update.callback_query.message.reply_text(mensagem, parse_mode="Markdown")
-    else:
-        await update.message.reply_text(mensagem, parse_mode="Markdown")
+    await enter_mode(
+        update, mode="editando_data_cartao", index=index_cartao, extra_state={"buffer": []}, prompt=PROMPTS["data"],
+    )
 
 
 async def add_comentario_cartao(update: Update, context: ContextTypes.DEFAULT_TYPE, index_cartao: int):
     """Inicia modo de adição de comentário para um cartão específico"""
-    user_id = update.effective_user.id if update.message else update.callback_query.from_user.id
-
-    state = user_states.get(user_id, {})
-    state.update({
-        "mode": "adicionando_comentario_cartao",
-        "index_cartao": index_cartao,
-        "buffer": []
-    })
-    user_states[user_id] = state
-
-    mensagem = "💬 *Modo de adição de comentário*\n\nEnvie o comentário:"
-
-    if update.callback_query:
-        await update.callback_query.message.reply_text(mensagem, parse_mode="Markdown")
-    else:
-        await update.message.reply_text(mensagem, parse_mode="Markdown")
+    await enter_mode(
+        update, mode="adicionando_comentario_cartao", index=index_cartao, extra_state={"buffer": []},
+        prompt=PROMPTS["comentario"],
+    )
 
 
 async def add_anexo_cartao(update: Update, context: ContextTypes.DEFAULT_TYPE, index_cartao: int):
     """Inicia modo de adição de anexo para um cartão específico - ACEITA QUALQUER TIPO DE ARQUIVO"""
-    user_id = update.effective_user.id if update.message else update.callback_query.from_user.id
-
-    state = user_states.get(user_id, {})
-    state.update({
-        "mode": "adicionando_anexo_cartao",
-        "index_cartao": index_cartao,
-        "anexos": []
-    })
-    user_states[user_id] = state
-
-    mensagem = (
-        "📎 *Modo de adição de anexos*\n\n"
-        "Agora envie os arquivos que deseja anexar.\n"
-        "✅ *Aceita qualquer tipo de arquivo:* imagens, PDFs, documentos, etc.\n\n"
-        "Após enviar todos os arquivos, use:\n"
-        "• `/ok` para finalizar e voltar à edição\n"
-        "• `/cancelar` para cancelar a operação\n\n"
-        "Ou clique no botão abaixo para finalizar:"
+    await enter_mode(
+        update, mode="adicionando_anexo_cartao", index=index_cartao, extra_state={"anexos": AnexosPendentes()},
+        prompt=PROMPTS["anexo"], keyboard=ANEXO_KB,
     )
 
-    # Cria teclado com botão de finalizar
-    keyboard = [[InlineKeyboardButton("✅ Finalizar Anexos", callback_data="finalizar_anexos")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
-    if update.callback_query:
-        await update.callback_query.message.reply_text(mensagem, parse_mode="Markdown", reply_markup=reply_markup)
-    else:
-        await update.message.reply_text(mensagem, parse_mode="Markdown", reply_markup=reply_markup)
-
 
 async def add_membro_cartao(update: Update, context: ContextTypes.DEFAULT_TYPE, index_cartao: int):
     """Inicia modo de adição de membro para um cartão específico com lista de múltipla escolha"""
@@ -1948,7 +2697,7 @@ async def add_membro_cartao(update: Update, context: ContextTypes.DEFAULT_TYPE,
 
         board_id = ud["board_id"]
         # Busca membros do quadro
-        membros = trello_request_for_user(user_id, "GET", f"/boards/{board_id}/members")
+        membros = await get_board_members_cached(user_id, board_id)
 
         if not membros:
             mensagem = "Nenhum membro encontrado no quadro."
@@ -1958,22 +2707,53 @@ async def add_membro_cartao(update: Update, context: ContextTypes.DEFAULT_TYPE,
                 await update.message.reply_text(mensagem)
             return
 
-        # Salva membros no contexto para seleção
+        # Salva membros no contexto para seleção (reaproveitados a cada clique até finalizar)
         context.user_data["membros_disponiveis"] = membros
+        context.user_data["_membros_by_id"] = {m['id']: m for m in membros}
         context.user_data["index_cartao_editando"] = index_cartao
+        # o próprio rascunho: se a posição passar a ser de outro cartão, a seleção é recusada
+        context.user_data["rascunho_selecao"] = rascunho_no_indice(user_id, index_cartao)
+
+    except Exception as e:
+        logger.exception(f"Erro ao carregar membros: {e}")
+        mensagem = "Erro ao carregar membros do quadro."
+        if update.callback_query:
+            await update.callback_query.message.reply_text(mensagem)
+        else:
+            await update.message.reply_text(mensagem)
+        return
+
+    await mostrar_selecao_membros(update, context)
+
+
+def _rotulo_membro(membro: Dict[str, Any], selecionado: bool) -> str:
+    return f"{'✅ ' if selecionado else '☐ '}{membro.get('fullName') or membro.get('username', 'Sem nome')}"
+
+
+def _rotulo_etiqueta(etiqueta: Dict[str, Any], selecionada: bool) -> str:
+    return (f"{'✅ ' if selecionada else '☐ '}"
+            f"{COLOR_EMOJI.get(etiqueta.get('color', ''), '⚪')} {etiqueta.get('name', 'Sem nome')}")
+
 
+async def mostrar_selecao_membros(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Desenha a seleção de membros com os dados já carregados em context.user_data"""
+    user_id = update.effective_user.id
+    membros = context.user_data.get("membros_disponiveis", [])
+    index_cartao = context.user_data.get("index_cartao_editando")
+
+    try:
         # Carrega membros já selecionados
         rascunhos = carregar_rascunhos(user_id)
-        membros_selecionados = []
+        membros_selecionados = set()
         if rascunhos and index_cartao < len(rascunhos):
-            membros_selecionados = rascunhos[index_cartao].get('membros_ids', [])
+            membros_selecionados = set(rascunhos[index_cartao].get('membros_ids', []))
 
         # Cria teclado com membros (múltipla seleção)
-        keyboard = []
-        for i, membro in enumerate(membros):
-            nome = membro.get('fullName') or membro.get('username', 'Sem nome')
-            selecionado = "✅ " if membro['id'] in membros_selecionados else "☐ "
-            keyboard.append([InlineKeyboardButton(f"{selecionado}{nome}", callback_data=f"selecionar_membro|{i}")])
+        keyboard = [
+            [InlineKeyboardButton(_rotulo_membro(membro, membro['id'] in membros_selecionados),
+                                  callback_data=callback_data("sm", i))]
+            for i, membro in enumerate(membros)
+        ]
 
         keyboard.append([InlineKeyboardButton("✅ Finalizar Seleção", callback_data="finalizar_selecao_membros")])
         keyboard.append([InlineKeyboardButton("⬅️ Voltar", callback_data=f"editar_cartao|{index_cartao}")])
@@ -1983,19 +2763,12 @@ async def add_membro_cartao(update: Update, context: ContextTypes.DEFAULT_TYPE,
         mensagem = "👥 *Selecionar Membros*\n\nClique nos membros para adicionar/remover (seleção múltipla):"
 
         if update.callback_query:
-            try:
-                await update.callback_query.edit_message_text(mensagem, parse_mode="Markdown", reply_markup=reply_markup)
-            except BadRequest as e:
-                if "Message is not modified" in str(e):
-                    # Ignora o erro se a mensagem não foi modificada
-                    await update.callback_query.answer("✅ Seleção atualizada")
-                else:
-                    raise e
+            await editar_render(update.callback_query, context, mensagem, reply_markup, "✅ Seleção atualizada")
         else:
             await update.message.reply_text(mensagem, parse_mode="Markdown", reply_markup=reply_markup)
 
     except Exception as e:
-        logger.exception(f"Erro ao carregar membros: {e}")
+        logger.exception(f"Erro ao mostrar membros: {e}")
         mensagem = "Erro ao carregar membros do quadro."
         if update.callback_query:
             await update.callback_query.message.reply_text(mensagem)
@@ -2019,7 +2792,7 @@ async def add_etiqueta_cartao(update: Update, context: ContextTypes.DEFAULT_TYPE
 
         board_id = ud["board_id"]
         # Busca etiquetas do quadro
-        etiquetas = get_board_labels(user_id, board_id)
+        etiquetas = await get_board_labels_cached(user_id, board_id)
 
         if not etiquetas:
             mensagem = "Nenhuma etiqueta encontrada no quadro."
@@ -2029,29 +2802,44 @@ async def add_etiqueta_cartao(update: Update, context: ContextTypes.DEFAULT_TYPE
                 await update.message.reply_text(mensagem)
             return
 
-        # Salva etiquetas no contexto para seleção
+        # Salva etiquetas no contexto para seleção (reaproveitadas a cada clique até finalizar)
         context.user_data["etiquetas_disponiveis"] = etiquetas
+        context.user_data["_etiquetas_by_id"] = {e['id']: e for e in etiquetas}
         context.user_data["index_cartao_editando"] = index_cartao
+        # o próprio rascunho: se a posição passar a ser de outro cartão, a seleção é recusada
+        context.user_data["rascunho_selecao"] = rascunho_no_indice(user_id, index_cartao)
+
+    except Exception as e:
+        logger.exception(f"Erro ao carregar etiquetas: {e}")
+        mensagem = "Erro ao carregar etiquetas do quadro."
+        if update.callback_query:
+            await update.callback_query.message.reply_text(mensagem)
+        else:
+            await update.message.reply_text(mensagem)
+        return
+
+    await mostrar_selecao_etiquetas(update, context)
+
+
+async def mostrar_selecao_etiquetas(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Desenha a seleção de etiquetas com os dados já carregados em context.user_data"""
+    user_id = update.effective_user.id
+    etiquetas = context.user_data.get("etiquetas_disponiveis", [])
+    index_cartao = context.user_data.get("index_cartao_editando")
 
+    try:
         # Carrega etiquetas já selecionadas
         rascunhos = carregar_rascunhos(user_id)
-        etiquetas_selecionadas = []
+        etiquetas_selecionadas = set()
         if rascunhos and index_cartao < len(rascunhos):
-            etiquetas_selecionadas = rascunhos[index_cartao].get('etiquetas_ids', [])
+            etiquetas_selecionadas = set(rascunhos[index_cartao].get('etiquetas_ids', []))
 
         # Cria teclado com etiquetas (múltipla seleção)
-        keyboard = []
-        for i, etiqueta in enumerate(etiquetas):
-            nome = etiqueta.get('name', 'Sem nome')
-            cor = etiqueta.get('color', '')
-            emoji_cor = {
-                'green': '🟢', 'yellow': '🟡', 'orange': '🟠', 'red': '🔴', 
-                'purple': '🟣', 'blue': '🔵', 'sky': '💠', 'lime': '🍏',
-                'pink': '🌸', 'black': '⚫'
-            }.get(cor, '⚪')
-            
-            selecionado = "✅ " if etiqueta['id'] in etiquetas_selecionadas else "☐ "
-            keyboard.append([InlineKeyboardButton(f"{selecionado}{emoji_cor} {nome}", callback_data=f"selecionar_etiqueta|{i}")])
+        keyboard = [
+            [InlineKeyboardButton(_rotulo_etiqueta(etiqueta, etiqueta['id'] in etiquetas_selecionadas),
+                                  callback_data=callback_data("se", i))]
+            for i, etiqueta in enumerate(etiquetas)
+        ]
 
         keyboard.append([InlineKeyboardButton("✅ Finalizar Seleção", callback_data="finalizar_selecao_etiquetas")])
         keyboard.append([InlineKeyboardButton("⬅️ Voltar", callback_data=f"editar_cartao|{index_cartao}")])
@@ -2061,19 +2849,12 @@ async def add_etiqueta_cartao(update: Update, context: ContextTypes.DEFAULT_TYPE
         mensagem = "🏷️ *Selecionar Etiquetas*\n\nClique nas etiquetas para adicionar/remover (seleção múltipla):"
 
         if update.callback_query:
-            try:
-                await update.callback_query.edit_message_text(mensagem, parse_mode="Markdown", reply_markup=reply_markup)
-            except BadRequest as e:
-                if "Message is not modified" in str(e):
-                    # Ignora o erro se a mensagem não foi modificada
-                    await update.callback_query.answer("✅ Seleção atualizada")
-                else:
-                    raise e
+            await editar_render(update.callback_query, context, mensagem, reply_markup, "✅ Seleção atualizada")
         else:
             await update.message.reply_text(mensagem, parse_mode="Markdown", reply_markup=reply_markup)
 
     except Exception as e:
-        logger.exception(f"Erro ao carregar etiquetas: {e}")
+        logger.exception(f"Erro ao mostrar etiquetas: {e}")
         mensagem = "Erro ao carregar etiquetas do quadro."
         if update.callback_query:
             await update.callback_query.message.reply_text(mensagem)
@@ -2081,12 +2862,9 @@ async def add_etiqueta_cartao(update: Update, context: ContextTypes.DEFAULT_TYPE
             await update.message.reply_text(mensagem)
 
 
-async def selecionar_membro_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def selecionar_membro_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, index_membro: int):
     """Manipula seleção/deseleção de membros"""
     query = update.callback_query
-    data = query.data
-
-    index_membro = int(data.split("|")[1])
     membros_disponiveis = context.user_data.get("membros_disponiveis", [])
     index_cartao = context.user_data.get("index_cartao_editando")
 
@@ -2094,48 +2872,46 @@ async def selecionar_membro_handler(update: Update, context: ContextTypes.DEFAUL
         await query.answer("Membro não encontrado")
         return
 
-    # Carrega rascunho atual
+    # A posição ainda é do cartão em que a seleção foi aberta? (ex.: não foi excluído)
+    # O callback já foi respondido por handle_callback_query: o aviso vai na própria mensagem.
     user_id = query.from_user.id
-    rascunhos = carregar_rascunhos(user_id)
-    if not rascunhos or index_cartao >= len(rascunhos):
-        await query.answer("Cartão não encontrado")
+    rascunho = rascunho_no_indice(user_id, index_cartao)
+    if rascunho is None or rascunho is not context.user_data.get("rascunho_selecao"):
+        await query.edit_message_text("⚠️ Este cartão foi alterado ou removido. Abra a seleção novamente.")
         return
-
-    rascunho = rascunhos[index_cartao]
-    membros_selecionados = rascunho.get('membros_ids', [])
+    membros_selecionados = set(rascunho.get('membros_ids', []))
 
     membro = membros_disponiveis[index_membro]
     membro_id = membro['id']
 
     # Alterna seleção
     if membro_id in membros_selecionados:
-        membros_selecionados.remove(membro_id)
+        membros_selecionados.discard(membro_id)
         status = "❌ Removido"
     else:
-        membros_selecionados.append(membro_id)
+        membros_selecionados.add(membro_id)
         status = "✅ Adicionado"
 
-    # Atualiza rascunho
-    rascunho['membros_ids'] = membros_selecionados
+    # Atualiza rascunho (ordenado para o JSON não mudar à toa)
+    rascunho['membros_ids'] = sorted(membros_selecionados)
+    by_id = context.user_data.get("_membros_by_id", {})
     rascunho['membros'] = [
-        membro['fullName'] or membro['username']
-        for membro in membros_disponiveis
-        if membro['id'] in membros_selecionados
+        by_id[mid]['fullName'] or by_id[mid]['username']
+        for mid in rascunho['membros_ids']
+        if mid in by_id
     ]
     rascunho['editado'] = True
     atualizar_rascunho(user_id, index_cartao, rascunho)
 
-    # Atualiza a mensagem com os novos estados
-    await add_membro_cartao(update, context, index_cartao)
+    # Só o botão clicado muda: troca apenas ele no teclado (o texto da mensagem é o mesmo)
+    if not await editar_botao(query, index_membro, _rotulo_membro(membro, membro_id in membros_selecionados)):
+        await mostrar_selecao_membros(update, context)
     await query.answer(f"{status}: {membro['fullName'] or membro['username']}")
 
 
-async def selecionar_etiqueta_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def selecionar_etiqueta_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, index_etiqueta: int):
     """Manipula seleção/deseleção de etiquetas"""
     query = update.callback_query
-    data = query.data
-
-    index_etiqueta = int(data.split("|")[1])
     etiquetas_disponiveis = context.user_data.get("etiquetas_disponiveis", [])
     index_cartao = context.user_data.get("index_cartao_editando")
 
@@ -2143,39 +2919,36 @@ async def selecionar_etiqueta_handler(update: Update, context: ContextTypes.DEFA
         await query.answer("Etiqueta não encontrada")
         return
 
-    # Carrega rascunho atual
+    # A posição ainda é do cartão em que a seleção foi aberta? (ex.: não foi excluído)
+    # O callback já foi respondido por handle_callback_query: o aviso vai na própria mensagem.
     user_id = query.from_user.id
-    rascunhos = carregar_rascunhos(user_id)
-    if not rascunhos or index_cartao >= len(rascunhos):
-        await query.answer("Cartão não encontrado")
+    rascunho = rascunho_no_indice(user_id, index_cartao)
+    if rascunho is None or rascunho is not context.user_data.get("rascunho_selecao"):
+        await query.edit_message_text("⚠️ Este cartão foi alterado ou removido. Abra a seleção novamente.")
         return
-
-    rascunho = rascunhos[index_cartao]
-    etiquetas_selecionadas = rascunho.get('etiquetas_ids', [])
+    etiquetas_selecionadas = set(rascunho.get('etiquetas_ids', []))
 
     etiqueta = etiquetas_disponiveis[index_etiqueta]
     etiqueta_id = etiqueta['id']
 
     # Alterna seleção
     if etiqueta_id in etiquetas_selecionadas:
-        etiquetas_selecionadas.remove(etiqueta_id)
+        etiquetas_selecionadas.discard(etiqueta_id)
         status = "❌ Removida"
     else:
-        etiquetas_selecionadas.append(etiqueta_id)
+        etiquetas_selecionadas.add(etiqueta_id)
         status = "✅ Adicionada"
 
-    # Atualiza rascunho
-    rascunho['etiquetas_ids'] = etiquetas_selecionadas
-    rascunho['etiquetas'] = [
-        etiqueta['name']
-        for etiqueta in etiquetas_disponiveis
-        if etiqueta['id'] in etiquetas_selecionadas
-    ]
+    # Atualiza rascunho (ordenado para o JSON não mudar à toa)
+    rascunho['etiquetas_ids'] = sorted(etiquetas_selecionadas)
+    by_id = context.user_data.get("_etiquetas_by_id", {})
+    rascunho['etiquetas'] = [by_id[eid]['name'] for eid in rascunho['etiquetas_ids'] if eid in by_id]
     rascunho['editado'] = True
     atualizar_rascunho(user_id, index_cartao, rascunho)
 
-    # Atualiza a mensagem com os novos estados
-    await add_etiqueta_cartao(update, context, index_cartao)
+    # Só o botão clicado muda: troca apenas ele no teclado (o texto da mensagem é o mesmo)
+    if not await editar_botao(query, index_etiqueta, _rotulo_etiqueta(etiqueta, etiqueta_id in etiquetas_selecionadas)):
+        await mostrar_selecao_etiquetas(update, context)
     await query.answer(f"{status}: {etiqueta['name']}")
 
 
@@ -2197,542 +2970,572 @@ async def finalizar_selecao_etiquetas(update: Update, context: ContextTypes.DEFA
     await mostrar_opcoes_edicao(query, context, index_cartao)
 
 
-async def criar_cartoes_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Cria todos os cartões a partir dos rascunhos"""
-    user_id = update.effective_user.id
-    users = load_users()
-
-    if not users.get(str(user_id)):
-        await update.message.reply_text("Configure suas credenciais primeiro com /start.")
-        return
+async def _tentar(coro, erro: str):
+    """Aguarda `coro`; se falhar, só registra o aviso (o cartão segue sendo criado)"""
+    try:
+        return await coro
+    except Exception as e:
+        logger.warning(f"{erro}: {e}")
 
-    rascunhos = carregar_rascunhos(user_id)
 
-    if not rascunhos:
-        await update.message.reply_text("Nenhum cartão para criar. Use /pedido para processar PDFs primeiro.")
-        return
+async def _criar_checklist_com_itens(user_id: int, card_id: str, checklist_data):
+    if isinstance(checklist_data, dict):
+        # Nova estrutura com itens
+        checklist_name = checklist_data['nome']
+        checklist_items = checklist_data.get('itens', [])
+    else:
+        # Estrutura antiga (apenas nome)
+        checklist_name = checklist_data
+        checklist_items = []
 
     try:
-        # Busca a lista "🚨 PEDIDOS SEM ARTE"
-        board_id = users[str(user_id)]["board_id"]
-        lists = get_board_lists(user_id, board_id)
+        checklist = await create_checklist(user_id, card_id, checklist_name)
 
-        lista_destino = None
-        for lst in lists:
-            if normalize_text(lst.get("name")) == normalize_text("🚨 PEDIDOS SEM ARTE"):
-                lista_destino = lst
-                break
+        # Adiciona os itens se houver
+        await add_checkitems(user_id, checklist["id"], checklist_items)
 
-        if not lista_destino:
-            await update.message.reply_text("❌ Lista '🚨 PEDIDOS SEM ARTE' não encontrada no quadro.")
-            return
+    except Exception as e:
+        logger.warning(f"Erro ao criar checklist {checklist_name}: {e}")
 
-        cartoes_criados = []
-        erros = []
 
-        for i, rascunho in enumerate(rascunhos, 1):
-            try:
-                # Prepara os dados do cartão
-                card_data = {
-                    "name": rascunho["titulo"],
-                    "desc": rascunho["descricao"],
-                    "idList": lista_destino["id"]
-                }
-
-                # Adiciona data se for válida
-                if rascunho["data_entrega"] and rascunho["data_entrega"] != "N/A":
-                    data_iso = parse_date_ddmmaa(rascunho["data_entrega"])
-                    if data_iso:
-                        card_data["due"] = data_iso
-                    else:
-                        logger.warning(f"Data inválida no cartão {i}: {rascunho['data_entrega']}")
-
-                # Cria o cartão
-                card = trello_request_for_user(user_id, "POST", "/cards", json_payload=card_data)
-                card_id = card["id"]
-
-                # Adiciona checklists
-                for checklist_data in rascunho.get("checklists", []):
-                    try:
-                        if isinstance(checklist_data, dict):
-                            # Nova estrutura com itens
-                            checklist_name = checklist_data['nome']
-                            checklist_items = checklist_data.get('itens', [])
-                        else:
-                            # Estrutura antiga (apenas nome)
-                            checklist_name = checklist_data
-                            checklist_items = []
-
-                        checklist = create_checklist(user_id, card_id, checklist_name)
-
-                        # Adiciona os itens se houver
-                        for item in checklist_items:
-                            add_checkitem(user_id, checklist["id"], item)
-
-                    except Exception as e:
-                        logger.warning(f"Erro ao criar checklist {checklist_name}: {e}")
-
-                # Adiciona comentários
-                if rascunho.get("comentarios"):
-                    try:
-                        add_comment(user_id, card_id, rascunho["comentarios"])
-                    except Exception as e:
-                        logger.warning(f"Erro ao adicionar comentário: {e}")
-
-                # Adiciona membros
-                for membro_id in rascunho.get("membros_ids", []):
-                    try:
-                        trello_request_for_user(user_id, "POST", f"/cards/{card_id}/idMembers",
-                                                params={"value": membro_id})
-                    except Exception as e:
-                        logger.warning(f"Erro ao adicionar membro {membro_id}: {e}")
-
-                # Adiciona etiquetas
-                for etiqueta_id in rascunho.get("etiquetas_ids", []):
-                    try:
-                        trello_request_for_user(user_id, "POST", f"/cards/{card_id}/idLabels",
-                                                params={"value": etiqueta_id})
-                    except Exception as e:
-                        logger.warning(f"Erro ao adicionar etiqueta {etiqueta_id}: {e}")
-
-                # CORREÇÃO: Adiciona anexos - AGORA FUNCIONANDO!
-                anexos_adicionados = 0
-                for anexo_path in rascunho.get("anexos", []):
-                    try:
-                        if os.path.exists(anexo_path):
-                            logger.info(f"Tentando adicionar anexo: {anexo_path} ao cartão {card_id}")
-                            result = upload_file_to_card(user_id, card_id, anexo_path)
-                            logger.info(f"Anexo adicionado com sucesso: {anexo_path} - Resultado: {result}")
-                            anexos_adicionados += 1
-                        else:
-                            logger.warning(f"Arquivo de anexo não encontrado: {anexo_path}")
-                    except Exception as e:
-                        logger.warning(f"Erro ao adicionar anexo {anexo_path}: {e}")
+async def _subir_anexo(user_id: int, card_id: str, anexo_path: str) -> bool:
+    """Sobe um anexo do rascunho para o cartão e apaga a cópia local; devolve se deu certo"""
+    try:
+        logger.debug("Tentando adicionar anexo: %s ao cartão %s", anexo_path, card_id)
+        result = await upload_file_to_card(user_id, card_id, anexo_path)
+        logger.debug("Anexo adicionado com sucesso: %s - Resultado: %s", anexo_path, result)
+        _remover_arquivo(anexo_path)  # já está no Trello
+        return True
+    except FileNotFoundError:
+        # o open() do upload é a verificação: sem stat() antes de cada arquivo
+        logger.warning(f"Arquivo de anexo não encontrado: {anexo_path}")
+        _remover_arquivo(anexo_path)  # só sobra o diretório vazio do anexo
+    except Exception as e:
+        logger.warning(f"Erro ao adicionar anexo {anexo_path}: {e}")
+    return False
 
-                cartoes_criados.append(card["name"])
-                mensagem_sucesso = f"✅ Cartão {i} criado: {card['name']}"
-                if anexos_adicionados > 0:
-                    mensagem_sucesso += f" (+{anexos_adicionados} anexos)"
-                await update.message.reply_text(mensagem_sucesso)
 
-            except Exception as e:
-                erro_msg = f"Cartão {i} ({rascunho['titulo']}): {str(e)}"
-                erros.append(erro_msg)
-                logger.error(f"Erro ao criar cartão {i}: {e}")
-                await update.message.reply_text(f"❌ Erro ao criar cartão {i}: {str(e)}")
+async def _criar_um_cartao(user_id: int, i: int, rascunho: Dict[str, Any], lista_id: str,
+                           vez: asyncio.Event, proxima: asyncio.Event):
+    """Cria no Trello o cartão `i` de um rascunho, com checklists, comentário, membros, etiquetas e anexos.
 
-        # Limpa rascunhos após criação
-        limpar_rascunhos(user_id)
+    Só o POST /cards segue a ordem dos rascunhos (espera `vez` e depois libera
+    `proxima`), para os cartões entrarem na lista na ordem da prévia; o restante
+    roda em paralelo. Devolve (cartão, anexos adicionados).
+    """
+    # Qualquer falha até o POST também libera o próximo cartão: senão os seguintes
+    # esperariam `vez` para sempre, segurando vagas do semáforo. Espera a vez antes
+    # de tudo, para um rascunho com erro não deixar o seguinte passar à frente.
+    try:
+        await vez.wait()
 
-        # Resumo final
-        if erros:
-            resumo = (
-                    f"📊 *Resumo da criação:*\n\n"
-                    f"✅ *Criados com sucesso:* {len(cartoes_criados)}\n"
-                    f"❌ *Com erro:* {len(erros)}\n\n"
-                    f"*Erros:*\n" + "\n".join(f"• {erro}" for erro in erros)
-            )
-        else:
-            resumo = f"🎉 *Todos os {len(cartoes_criados)} cartões foram criados com sucesso!*"
+        # Prepara os dados do cartão
+        card_data = {
+            "name": rascunho["titulo"],
+            "desc": rascunho["descricao"],
+            "idList": lista_id
+        }
 
-        await update.message.reply_text(resumo, parse_mode="Markdown")
+        # Adiciona data se for válida
+        if rascunho["data_entrega"] and rascunho["data_entrega"] != "N/A":
+            data_iso = parse_date_ddmmaa(rascunho["data_entrega"])
+            if data_iso:
+                card_data["due"] = data_iso
+            else:
+                logger.warning(f"Data inválida no cartão {i}: {rascunho['data_entrega']}")
 
-    except Exception as e:
-        logger.exception(f"Erro geral ao criar cartões: {e}")
-        await update.message.reply_text(f"❌ Erro ao criar cartões: {str(e)}")
+        # Cria o cartão
+        card = await trello_request_for_user(user_id, "POST", "/cards", json_payload=card_data)
+    finally:
+        proxima.set()
+    card_id = card["id"]
+
+    # Checklists, comentário, membros e etiquetas não dependem uns dos outros
+    tarefas = [_criar_checklist_com_itens(user_id, card_id, c) for c in rascunho.get("checklists", [])]
+    if rascunho.get("comentarios"):
+        tarefas.append(_tentar(add_comment(user_id, card_id, rascunho["comentarios"]),
+                               "Erro ao adicionar comentário"))
+    tarefas += [
+        _tentar(trello_request_for_user(user_id, "POST", f"/cards/{card_id}/idMembers", params={"value": membro_id}),
+                f"Erro ao adicionar membro {membro_id}")
+        for membro_id in rascunho.get("membros_ids", [])
+    ]
+    tarefas += [
+        _tentar(trello_request_for_user(user_id, "POST", f"/cards/{card_id}/idLabels", params={"value": etiqueta_id}),
+                f"Erro ao adicionar etiqueta {etiqueta_id}")
+        for etiqueta_id in rascunho.get("etiquetas_ids", [])
+    ]
+    # Os anexos sobem junto com o resto (cada upload envia o arquivo em partes a partir do disco)
+    uploads = [_subir_anexo(user_id, card_id, anexo_path) for anexo_path in rascunho.get("anexos", [])]
+    resultados = await asyncio.gather(*tarefas, *uploads)
+    anexos_adicionados = sum(1 for ok in resultados[len(tarefas):] if ok)
 
+    return card, anexos_adicionados
 
-async def criar_cartoes_cmd_from_callback(query, context):
-    """Versão do criar_cartoes_cmd para ser chamada via callback"""
-    user_id = query.from_user.id
+
+async def _criar_cartoes_core(user_id: int, notify: Callable[..., Awaitable[Any]],
+                              avisar_erros: bool = False) -> Optional[str]:
+    """Cria no Trello todos os cartões dos rascunhos do usuário.
+
+    `notify(texto)` mostra um texto ao usuário (mensagem nova no /criar, edição da
+    mensagem no botão) e devolve a mensagem, que passa a mostrar o progresso. Com
+    `avisar_erros`, cada cartão que falhar também é avisado na hora. Devolve o
+    resumo final (Markdown), ou None quando o motivo de não criar já foi avisado.
+    """
     users = load_users()
 
     if not users.get(str(user_id)):
-        await query.edit_message_text("Configure suas credenciais primeiro com /start.")
-        return
+        await notify("Configure suas credenciais primeiro com /start.")
+        return None
 
-    rascunhos = carregar_rascunhos(user_id)
+    # Cópia: rascunhos novos que chegarem durante a criação ficam para a próxima.
+    # Os PDFs já enviados entram nesta criação, mesmo que ainda estejam em processamento.
+    await concluir_lotes_pdf(user_id)
+    rascunhos = list(carregar_rascunhos(user_id))
 
     if not rascunhos:
-        await query.edit_message_text("Nenhum cartão para criar. Use /pedido para processar PDFs primeiro.")
-        return
+        await notify("Nenhum cartão para criar. Use /pedido para processar PDFs primeiro.")
+        return None
 
     try:
         # Busca a lista "🚨 PEDIDOS SEM ARTE"
         board_id = users[str(user_id)]["board_id"]
-        lists = get_board_lists(user_id, board_id)
-
-        lista_destino = None
-        for lst in lists:
-            if normalize_text(lst.get("name")) == normalize_text("🚨 PEDIDOS SEM ARTE"):
-                lista_destino = lst
-                break
+        lista_destino = await buscar_no_quadro_por_nome("lists", user_id, board_id, LISTA_NOVOS_PEDIDOS)
 
         if not lista_destino:
-            await query.edit_message_text("❌ Lista '🚨 PEDIDOS SEM ARTE' não encontrada no quadro.")
-            return
+            await notify("❌ Lista '🚨 PEDIDOS SEM ARTE' não encontrada no quadro.")
+            return None
 
         cartoes_criados = []
         erros = []
-
-        for i, rascunho in enumerate(rascunhos, 1):
-            try:
-                # Prepara os dados do cartão
-                card_data = {
-                    "name": rascunho["titulo"],
-                    "desc": rascunho["descricao"],
-                    "idList": lista_destino["id"]
-                }
-
-                # Adiciona data se for válida
-                if rascunho["data_entrega"] and rascunho["data_entrega"] != "N/A":
-                    data_iso = parse_date_ddmmaa(rascunho["data_entrega"])
-                    if data_iso:
-                        card_data["due"] = data_iso
-                    else:
-                        logger.warning(f"Data inválida no cartão {i}: {rascunho['data_entrega']}")
-
-                # Cria o cartão
-                card = trello_request_for_user(user_id, "POST", "/cards", json_payload=card_data)
-                card_id = card["id"]
-
-                # Adiciona checklists
-                for checklist_data in rascunho.get("checklists", []):
-                    try:
-                        if isinstance(checklist_data, dict):
-                            # Nova estrutura com itens
-                            checklist_name = checklist_data['nome']
-                            checklist_items = checklist_data.get('itens', [])
-                        else:
-                            # Estrutura antiga (apenas nome)
-                            checklist_name = checklist_data
-                            checklist_items = []
-
-                        checklist = create_checklist(user_id, card_id, checklist_name)
-
-                        # Adiciona os itens se houver
-                        for item in checklist_items:
-                            add_checkitem(user_id, checklist["id"], item)
-
-                    except Exception as e:
-                        logger.warning(f"Erro ao criar checklist {checklist_name}: {e}")
-
-                # Adiciona comentários
-                if rascunho.get("comentarios"):
-                    try:
-                        add_comment(user_id, card_id, rascunho["comentarios"])
-                    except Exception as e:
-                        logger.warning(f"Erro ao adicionar comentário: {e}")
-
-                # Adiciona membros
-                for membro_id in rascunho.get("membros_ids", []):
-                    try:
-                        trello_request_for_user(user_id, "POST", f"/cards/{card_id}/idMembers",
-                                                params={"value": membro_id})
-                    except Exception as e:
-                        logger.warning(f"Erro ao adicionar membro {membro_id}: {e}")
-
-                # Adiciona etiquetas
-                for etiqueta_id in rascunho.get("etiquetas_ids", []):
-                    try:
-                        trello_request_for_user(user_id, "POST", f"/cards/{card_id}/idLabels",
-                                                params={"value": etiqueta_id})
-                    except Exception as e:
-                        logger.warning(f"Erro ao adicionar etiqueta {etiqueta_id}: {e}")
-
-                # CORREÇÃO: Adiciona anexos - AGORA FUNCIONANDO!
-                anexos_adicionados = 0
-                for anexo_path in rascunho.get("anexos", []):
-                    try:
-                        if os.path.exists(anexo_path):
-                            logger.info(f"Tentando adicionar anexo: {anexo_path} ao cartão {card_id}")
-                            result = upload_file_to_card(user_id, card_id, anexo_path)
-                            logger.info(f"Anexo adicionado com sucesso: {anexo_path} - Resultado: {result}")
-                            anexos_adicionados += 1
-                        else:
-                            logger.warning(f"Arquivo de anexo não encontrado: {anexo_path}")
-                    except Exception as e:
-                        logger.warning(f"Erro ao adicionar anexo {anexo_path}: {e}")
-
+        mensagem_progresso = await notify(f"⏳ Criando cartões: 0/{len(rascunhos)}")
+        progresso = Progresso(mensagem_progresso, len(rascunhos), "⏳ Criando cartões", a_cada=3)
+
+        # Cria os cartões em paralelo (até CRIAR_CONCORRENCIA por vez); os POST /cards saem em ordem
+        limite = asyncio.Semaphore(CRIAR_CONCORRENCIA)
+        vezes = [asyncio.Event() for _ in range(len(rascunhos) + 1)]
+        vezes[0].set()
+
+        async def criar(i: int, rascunho: Dict[str, Any]):
+            async with limite:
+                try:
+                    return i, await _criar_um_cartao(user_id, i, rascunho, lista_destino["id"],
+                                                     vezes[i - 1], vezes[i]), None
+                except Exception as e:
+                    return i, None, e
+
+        # Cada cartão é contado assim que termina, na ordem em que ficam prontos
+        tarefas = [asyncio.create_task(criar(i, rascunho)) for i, rascunho in enumerate(rascunhos, 1)]
+        for pronto in asyncio.as_completed(tarefas):
+            i, resultado, erro = await pronto
+            if erro is None:
+                card, anexos_adicionados = resultado
                 cartoes_criados.append(card["name"])
-
-            except Exception as e:
-                erro_msg = f"Cartão {i} ({rascunho['titulo']}): {str(e)}"
-                erros.append(erro_msg)
-                logger.error(f"Erro ao criar cartão {i}: {e}")
-
-        # Limpa rascunhos após criação
+                logger.info(f"Cartão {i} criado: {card['name']} (+{anexos_adicionados} anexos)")
+            else:
+                erros.append(f"Cartão {i} ({rascunhos[i - 1]['titulo']}): {str(erro)}")
+                logger.error(f"Erro ao criar cartão {i}: {erro}")
+                if avisar_erros:
+                    await notify(f"❌ Erro ao criar cartão {i}: {str(erro)}")
+            await progresso.avancar()
+
+        # Limpa só os rascunhos desta criação: os que chegaram enquanto criava (mesmo
+        # depois de um /pedido, que recomeça a lista) continuam. A cópia mantém esses
+        # objetos vivos, então o id() identifica cada um.
+        criados = {id(rascunho) for rascunho in rascunhos}
+        restantes = [r for r in carregar_rascunhos(user_id) if id(r) not in criados]
         limpar_rascunhos(user_id)
+        for rascunho in restantes:
+            salvar_rascunho(user_id, rascunho)
 
         # Resumo final
         if erros:
-            resumo = (
+            return (
                     f"📊 *Resumo da criação:*\n\n"
                     f"✅ *Criados com sucesso:* {len(cartoes_criados)}\n"
                     f"❌ *Com erro:* {len(erros)}\n\n"
                     f"*Erros:*\n" + "\n".join(f"• {erro}" for erro in erros)
             )
-        else:
-            resumo = f"🎉 *Todos os {len(cartoes_criados)} cartões foram criados com sucesso!*"
-
-        await query.edit_message_text(resumo, parse_mode="Markdown")
+        return f"🎉 *Todos os {len(cartoes_criados)} cartões foram criados com sucesso!*"
 
     except Exception as e:
         logger.exception(f"Erro geral ao criar cartões: {e}")
-        await query.edit_message_text(f"❌ Erro ao criar cartões: {str(e)}")
+        await notify(f"❌ Erro ao criar cartões: {str(e)}")
+        return None
 
 
-async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Manipula documentos (PDFs) enviados"""
-    user_id = update.effective_user.id
-    state = user_states.get(user_id, {})
+# Usuários com uma criação de cartões em andamento (evita criar os mesmos rascunhos duas vezes)
+_criacoes_em_andamento: set = set()
 
-    if state.get("mode") == "coletando_pdfs":
-        # Modo de coleta de PDFs para criação de cartões - APENAS PDFs
-        document = update.message.document
-        if not document.mime_type or "pdf" not in document.mime_type.lower():
-            await update.message.reply_text("❌ Por favor, envie apenas arquivos PDF.")
-            return
 
+async def _criar_em_segundo_plano(user_id: int, notify: Callable[..., Awaitable[Any]],
+                                  avisar_erros: bool = False):
+    """Responde na hora e cria os cartões numa tarefa à parte; o resumo chega por `notify` no fim"""
+    if user_id in _criacoes_em_andamento:
+        await notify("⏳ Seus cartões já estão sendo criados. Te aviso quando terminar.")
+        return
+
+    _criacoes_em_andamento.add(user_id)
+    await notify("⏳ Criando em segundo plano, te aviso quando terminar.")
+
+    async def criar():
         try:
-            # Baixa o arquivo
-            file = await context.bot.get_file(document.file_id)
-            file_path = os.path.join(DOWNLOAD_DIR, f"{user_id}_{document.file_name}")
-            await file.download_to_drive(file_path)
+            resumo = await _criar_cartoes_core(user_id, notify, avisar_erros)
+            if resumo:
+                await notify(resumo, parse_mode="Markdown")
+        except Exception as e:
+            logger.exception(f"Erro ao criar cartões em segundo plano: {e}")
+        finally:
+            _criacoes_em_andamento.discard(user_id)
 
-            # Extrai informações do PDF
-            dados_cartao = extract_info_from_pdf(file_path)
+    _spawn(criar())
 
-            if not dados_cartao:
-                await update.message.reply_text("❌ Não foi possível extrair informações do PDF.")
-                os.remove(file_path)
-                return
 
-            # Salva como rascunho
-            salvar_rascunho(user_id, dados_cartao)
+async def criar_cartoes_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Cria todos os cartões a partir dos rascunhos"""
+    await _criar_em_segundo_plano(update.effective_user.id, update.message.reply_text, avisar_erros=True)
 
-            # Remove o arquivo PDF temporário
-            os.remove(file_path)
 
-            # Conta quantos rascunhos existem
-            rascunhos = carregar_rascunhos(user_id)
-            total_rascunhos = len(rascunhos)
+async def criar_cartoes_cmd_from_callback(query, context):
+    """Versão do criar_cartoes_cmd para ser chamada via callback"""
+    await _criar_em_segundo_plano(query.from_user.id, query.edit_message_text)
 
-            await update.message.reply_text(
-                f"✅ PDF processado com sucesso! ({total_rascunhos} cartão(s) aguardando)\n\n"
-                f"Use `/ok` para ver a prévia ou continue enviando mais PDFs.",
-                parse_mode="Markdown"
-            )
 
-        except Exception as e:
-            logger.exception(f"Erro ao processar PDF: {e}")
-            await update.message.reply_text(f"❌ Erro ao processar PDF: {str(e)}")
+class LotePDFs:
+    """PDFs que um usuário mandou em sequência, extraídos juntos e respondidos numa só mensagem"""
 
-    elif state.get("mode") == "adicionando_anexo_cartao":
-        # Modo de adição de anexos para cartões em criação - QUALQUER TIPO DE ARQUIVO
-        document = update.message.document
-        try:
-            # Baixa o arquivo
-            file = await context.bot.get_file(document.file_id)
-            file_path = os.path.join(DOWNLOAD_DIR, f"{user_id}_{document.file_name}")
-            await file.download_to_drive(file_path)
+    def __init__(self):
+        self.arquivos: List[tuple] = []  # (download em andamento -> caminho local, nome original)
+        self.mensagem = None  # última mensagem recebida (a resposta vai para ela)
+        self.ultimo = time.monotonic()
+        self.fechar = asyncio.Event()  # processa já, sem esperar a janela (ex.: /ok, /criar)
 
-            # Adiciona ao estado temporário
-            anexos = state.get("anexos", [])
-            anexos.append(file_path)
-            state["anexos"] = anexos
-            user_states[user_id] = state
+    def adicionar(self, download: asyncio.Task, nome: str, mensagem):
+        self.arquivos.append((download, nome))
+        self.mensagem = mensagem
+        self.ultimo = time.monotonic()
 
-            await update.message.reply_text(
-                f"✅ Arquivo '{document.file_name}' recebido. \n"
-                f"Total de anexos: {len(anexos)}\n\n"
-                f"Envie mais arquivos ou use `/ok` para finalizar."
-            )
 
-        except Exception as e:
-            logger.exception(f"Erro ao processar anexo: {e}")
-            await update.message.reply_text(f"❌ Erro ao processar arquivo: {str(e)}")
+# lote de PDFs em formação por usuário
+_lotes_pdf: Dict[int, LotePDFs] = {}
+# tarefas de lotes ainda não salvos por usuário (em formação ou extraindo)
+_tarefas_lotes_pdf: Dict[int, set] = {}
 
-    elif state.get("mode") == "adicionando_anexo_existente":
-        # Modo de adição de anexos para cartões existentes (busca) - QUALQUER TIPO DE ARQUIVO
-        document = update.message.document
-        try:
-            # Baixa o arquivo
-            file = await context.bot.get_file(document.file_id)
-            file_path = os.path.join(DOWNLOAD_DIR, f"{user_id}_{document.file_name}")
-            await file.download_to_drive(file_path)
 
-            # Adiciona ao estado temporário
-            anexos = state.get("anexos", [])
-            anexos.append(file_path)
-            state["anexos"] = anexos
-            user_states[user_id] = state
+async def concluir_lotes_pdf(user_id: int):
+    """Processa já o lote em formação e espera os lotes pendentes do usuário virarem rascunhos.
 
-            await update.message.reply_text(
-                f"✅ Arquivo '{document.file_name}' recebido. \n"
-                f"Total de anexos: {len(anexos)}\n\n"
-                f"Envie mais arquivos ou use `/ok` para finalizar e adicionar ao cartão."
-            )
+    Chamado por quem lê os rascunhos (/ok, /criar), que senão veria só parte dos PDFs.
+    """
+    lote = _lotes_pdf.get(user_id)
+    if lote is not None:
+        lote.fechar.set()
+    tarefas = list(_tarefas_lotes_pdf.get(user_id, ()))
+    if tarefas:
+        await asyncio.gather(*tarefas, return_exceptions=True)
 
-        except Exception as e:
-            logger.exception(f"Erro ao processar anexo: {e}")
-            await update.message.reply_text(f"❌ Erro ao processar arquivo: {str(e)}")
 
+def cancelar_lotes_pdf(user_id: int):
+    """Descarta os lotes pendentes do usuário (/cancelar, novo /pedido); os arquivos baixados são apagados"""
+    _lotes_pdf.pop(user_id, None)
+    for tarefa in _tarefas_lotes_pdf.pop(user_id, ()):
+        tarefa.cancel()
+
+
+def _iniciar_lote_pdf(user_id: int, context: ContextTypes.DEFAULT_TYPE) -> LotePDFs:
+    lote = _lotes_pdf[user_id] = LotePDFs()
+    tarefas = _tarefas_lotes_pdf.setdefault(user_id, set())
+    tarefa = _spawn(_processar_lote_pdfs(user_id, lote, context))
+    tarefas.add(tarefa)
+    tarefa.add_done_callback(tarefas.discard)
+    return lote
+
+
+async def _processar_lote_pdfs(user_id: int, lote: LotePDFs, context: ContextTypes.DEFAULT_TYPE):
+    """Espera os PDFs pararem de chegar, extrai todos em paralelo e responde uma vez"""
+    try:
+        while not lote.fechar.is_set() and (espera := lote.ultimo + PDF_BATCH_WINDOW - time.monotonic()) > 0:
+            try:
+                await asyncio.wait_for(lote.fechar.wait(), espera)
+            except asyncio.TimeoutError:
+                pass
+        # PDFs que chegarem a partir daqui formam um novo lote
+        if _lotes_pdf.get(user_id) is lote:
+            del _lotes_pdf[user_id]
+
+        async def extrair(download: asyncio.Task):
+            # cada PDF é extraído assim que o seu download termina
+            caminho = await download
+            try:
+                return await extrair_pdf(context, caminho)
+            finally:
+                _remover_arquivo(caminho)
+
+        resultados = await asyncio.gather(*(extrair(download) for download, _ in lote.arquivos),
+                                          return_exceptions=True)
+        total_rascunhos = None
+        falhas = []
+        for (_, nome), dados_cartao in zip(lote.arquivos, resultados):
+            if isinstance(dados_cartao, Exception):
+                logger.warning(f"Erro ao processar PDF {nome}: {dados_cartao}")
+            if not dados_cartao or isinstance(dados_cartao, Exception):
+                falhas.append(nome)
+                continue
+            # Salva como rascunho (o índice do novo rascunho já diz quantos existem)
+            total_rascunhos = salvar_rascunho(user_id, dados_cartao) + 1
+
+        partes = []
+        if total_rascunhos is not None:
+            processados = len(lote.arquivos) - len(falhas)
+            partes.append(f"✅ {processados} PDF(s) processado(s) com sucesso! "
+                          f"({total_rascunhos} cartão(s) aguardando)")
+        if falhas:
+            partes.append("❌ Não foi possível extrair informações de: " + ", ".join(falhas))
+        partes.append("Use /ok para ver a prévia ou continue enviando mais PDFs.")
+        await lote.mensagem.reply_text("\n\n".join(partes))
+
+    except asyncio.CancelledError:
+        # lote descartado: nada vira rascunho e nenhum arquivo fica no disco
+        for download, _ in lote.arquivos:
+            download.cancel()
+            if download.done() and not download.cancelled() and download.exception() is None:
+                _remover_arquivo(download.result())
+        raise
+
+    except Exception as e:
+        logger.exception(f"Erro ao processar PDFs: {e}")
+        await lote.mensagem.reply_text(f"❌ Erro ao processar PDF: {str(e)}")
+
+
+async def _baixar_pdf(context: ContextTypes.DEFAULT_TYPE, user_id: int, document) -> str:
+    file = await context.bot.get_file(document.file_id)
+    file_path = _caminho_anexo(user_id, document.file_name)  # único: o lote pode ter nomes repetidos
+    try:
+        await baixar_arquivo(file, file_path)
+    except (Exception, asyncio.CancelledError):
+        _remover_arquivo(file_path)  # não sobra arquivo parcial nem o diretório do anexo
+        raise
+    return file_path
+
+
+async def _documento_pdf_pedido(update: Update, context: ContextTypes.DEFAULT_TYPE, state: Dict[str, Any], document):
+    """Modo de coleta de PDFs para criação de cartões - APENAS PDFs"""
+    user_id = update.effective_user.id
+    if not document.mime_type or "pdf" not in document.mime_type.lower():
+        await update.message.reply_text("❌ Por favor, envie apenas arquivos PDF.")
+        return
+
+    # Entra no lote do usuário já ao chegar (reiniciando a janela) e baixa em segundo
+    # plano: assim o próximo PDF é recebido sem esperar este download. A extração
+    # roda quando os PDFs param de chegar, e espera os downloads pendentes.
+    lote = _lotes_pdf.get(user_id)
+    if lote is None:
+        lote = _iniciar_lote_pdf(user_id, context)
+    lote.adicionar(asyncio.create_task(_baixar_pdf(context, user_id, document)), document.file_name,
+                   update.message)
+
+
+async def _documento_anexo(update: Update, context: ContextTypes.DEFAULT_TYPE, state: Dict[str, Any], document):
+    """Modos de adição de anexos (cartão em criação ou cartão existente) - QUALQUER TIPO DE ARQUIVO"""
+    user_id = update.effective_user.id
+    try:
+        # Baixa o arquivo
+        file = await context.bot.get_file(document.file_id)
+        file_path = _caminho_anexo(user_id, document.file_name)
+        await baixar_arquivo(file, file_path)
+
+        # Adiciona ao estado temporário (só o caminho; o conteúdo fica no disco)
+        anexos = state.setdefault("anexos", AnexosPendentes())
+        anexos.append(file_path)
+        await state_store.set(user_id, state)
+
+        finalizar = "finalizar e adicionar ao cartão" if state.get("mode") == "adicionando_anexo_existente" else "finalizar"
+        await update.message.reply_text(
+            f"✅ Arquivo '{document.file_name}' recebido. \n"
+            f"Total de anexos: {len(anexos)}\n\n"
+            f"Envie mais arquivos ou use `/ok` para {finalizar}."
+        )
+
+    except Exception as e:
+        logger.exception(f"Erro ao processar anexo: {e}")
+        await update.message.reply_text(f"❌ Erro ao processar arquivo: {str(e)}")
+
+
+# Modo atual do usuário -> coroutine que trata o documento recebido nesse modo
+DOCUMENT_MODE_HANDLERS = MappingProxyType({
+    "coletando_pdfs": _documento_pdf_pedido,
+    "adicionando_anexo_cartao": _documento_anexo,
+    "adicionando_anexo_existente": _documento_anexo,
+})
+
+
+async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Manipula documentos (PDFs) enviados"""
+    state = await state_store.get(update.effective_user.id)
+    handler = DOCUMENT_MODE_HANDLERS.get(state.get("mode"))
+    if handler:
+        await handler(update, context, state, update.message.document)
     else:
         # Modo anexo normal - QUALQUER TIPO DE ARQUIVO
         await handle_anexo_document(update, context)
 
 
-async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Manipula callbacks dos botões inline"""
-    query = update.callback_query
-    await query.answer()
+def _via_query(handler):
+    """Adapta handlers que recebem (query, context, ...) à assinatura (update, context, ...) das rotas"""
+    async def rota(update: Update, context: ContextTypes.DEFAULT_TYPE, *args):
+        return await handler(update.callback_query, context, *args)
+    return rota
 
-    data = query.data
+
+async def excluir_cartao_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, index_cartao: int):
+    await update.callback_query.edit_message_text(f"❌ Funcionalidade de exclusão ainda não implementada.")
+
+
+async def finalizar_anexos_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Guarda no rascunho os anexos enviados no modo de anexos e volta para a edição"""
+    query = update.callback_query
     user_id = query.from_user.id
+    state = await state_store.get(user_id)
+    if state.get("mode") != "adicionando_anexo_cartao":
+        return
 
-    if data == "atualizar_previa":
-        await ok_cmd_from_callback(query, context)
+    index_cartao = state.get("index_cartao")
+    anexos_temp = state.get("anexos", [])
 
-    elif data == "criar_todos_cartoes":
-        await criar_cartoes_cmd_from_callback(query, context)
+    if not anexos_temp:
+        await query.edit_message_text("❌ Nenhum anexo foi enviado.")
+        return
 
-    elif data.startswith("editar_cartao|"):
-        index_cartao = int(data.split("|")[1])
-        await mostrar_opcoes_edicao(query, context, index_cartao)
+    # Salva os anexos no rascunho
+    rascunhos = carregar_rascunhos(user_id)
+    if not rascunhos or not 0 <= index_cartao < len(rascunhos):
+        await query.edit_message_text("❌ Cartão não encontrado.")
+        return
 
-    elif data == "voltar_previa":
-        await ok_cmd_from_callback(query, context)
+    rascunho = rascunhos[index_cartao]
+    if "anexos" not in rascunho:
+        rascunho["anexos"] = []
 
-    elif data.startswith("excluir_cartao|"):
-        index_cartao = int(data.split("|")[1])
-        await query.edit_message_text(f"❌ Funcionalidade de exclusão ainda não implementada.")
+    rascunho["anexos"].extend(anexos_temp)
+    rascunho["editado"] = True
+    atualizar_rascunho(user_id, index_cartao, rascunho)
 
-    elif data.startswith("editar_data|"):
-        index_cartao = int(data.split("|")[1])
-        await editar_data_cartao(update, context, index_cartao)
+    await query.edit_message_text(f"✅ {len(anexos_temp)} anexo(s) adicionado(s) ao cartão!")
 
-    elif data.startswith("add_comentario|"):
-        index_cartao = int(data.split("|")[1])
-        await add_comentario_cartao(update, context, index_cartao)
+    # Limpa o estado
+    state["mode"] = None
+    state["anexos"] = AnexosPendentes()  # arquivos agora pertencem ao rascunho
+    await state_store.set(user_id, state)
 
-    elif data.startswith("add_checklist|"):
-        index_cartao = int(data.split("|")[1])
-        await add_checklist_cartao(update, context, index_cartao)
+    # Volta para as opções de edição
+    await mostrar_opcoes_edicao(query, context, index_cartao)
 
-    elif data.startswith("add_membro|"):
-        index_cartao = int(data.split("|")[1])
-        await add_membro_cartao(update, context, index_cartao)
 
-    elif data.startswith("add_etiqueta|"):
-        index_cartao = int(data.split("|")[1])
-        await add_etiqueta_cartao(update, context, index_cartao)
+async def nova_busca_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.edit_message_text("🔍 Digite /buscar <termo> para realizar uma nova busca.")
 
-    elif data.startswith("add_anexo|"):
-        index_cartao = int(data.split("|")[1])
-        await add_anexo_cartao(update, context, index_cartao)
 
-    # Novos handlers para seleção de membros
-    elif data.startswith("selecionar_membro|"):
-        await selecionar_membro_handler(update, context)
+async def atualizar_previa_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """"🔄 Atualizar Prévia": recarrega também listas/etiquetas/membros do quadro"""
+    invalidar_quadro_do_usuario(update.callback_query.from_user.id)
+    await ok_cmd_from_callback(update.callback_query, context)
 
-    elif data == "finalizar_selecao_membros":
-        await finalizar_selecao_membros(update, context)
 
-    # Novos handlers para seleção de etiquetas
-    elif data.startswith("selecionar_etiqueta|"):
-        await selecionar_etiqueta_handler(update, context)
+async def atualizar_cartao_busca_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, index_cartao: int):
+    """"🔄 Atualizar" do cartão da busca: recarrega também listas/etiquetas/membros do quadro"""
+    invalidar_quadro_do_usuario(update.callback_query.from_user.id)
+    await mostrar_opcoes_edicao_cartao_existente(update.callback_query, context, index_cartao)
 
-    elif data == "finalizar_selecao_etiquetas":
-        await finalizar_selecao_etiquetas(update, context)
 
-    # Handler para finalizar anexos
-    elif data == "finalizar_anexos":
-        state = user_states.get(user_id, {})
-        if state.get("mode") == "adicionando_anexo_cartao":
-            index_cartao = state.get("index_cartao")
-            anexos_temp = state.get("anexos", [])
-            
-            if anexos_temp:
-                # Salva os anexos no rascunho
-                rascunhos = carregar_rascunhos(user_id)
-                if rascunhos and 0 <= index_cartao < len(rascunhos):
-                    rascunho = rascunhos[index_cartao]
-                    if "anexos" not in rascunho:
-                        rascunho["anexos"] = []
-                    
-                    rascunho["anexos"].extend(anexos_temp)
-                    rascunho["editado"] = True
-                    atualizar_rascunho(user_id, index_cartao, rascunho)
-                    
-                    await query.edit_message_text(f"✅ {len(anexos_temp)} anexo(s) adicionado(s) ao cartão!")
-                    
-                    # Limpa o estado
-                    state["mode"] = None
-                    state["anexos"] = []
-                    user_states[user_id] = state
-                    
-                    # Volta para as opções de edição
-                    await mostrar_opcoes_edicao(query, context, index_cartao)
-                else:
-                    await query.edit_message_text("❌ Cartão não encontrado.")
-            else:
-                await query.edit_message_text("❌ Nenhum anexo foi enviado.")
-        
-        return
+async def voltar_busca_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    state = await state_store.get(query.from_user.id)
+    cartoes_encontrados = state.get("cartoes_encontrados", [])
+    termo_busca = state.get("termo_busca", "")
+    if cartoes_encontrados:
+        await mostrar_resultados_busca_from_callback(query, context, cartoes_encontrados, termo_busca)
+    else:
+        await query.edit_message_text("❌ Nenhum resultado de busca encontrado. Use /buscar para uma nova busca.")
+
+
+# Rotas do callback_data compacto ("v1:<rota>:<args>"): rota -> (handler, conversores dos args)
+CALLBACK_ROUTES = MappingProxyType({
+    "sm": (selecionar_membro_handler, (int,)),
+    "se": (selecionar_etiqueta_handler, (int,)),
+    "ml": (mover_para_lista_handler, (int, str)),
+})
+
+# Rotas do callback_data "<prefixo>|<args>", no mesmo formato de CALLBACK_ROUTES
+CALLBACK_HANDLERS = MappingProxyType({
+    "atualizar_previa": (atualizar_previa_callback, ()),
+    "voltar_previa": (_via_query(ok_cmd_from_callback), ()),
+    "criar_todos_cartoes": (_via_query(criar_cartoes_cmd_from_callback), ()),
+    "editar_cartao": (_via_query(mostrar_opcoes_edicao), (int,)),
+    "excluir_cartao": (excluir_cartao_callback, (int,)),
+    "editar_data": (editar_data_cartao, (int,)),
+    "add_comentario": (add_comentario_cartao, (int,)),
+    "add_checklist": (add_checklist_cartao, (int,)),
+    "add_membro": (add_membro_cartao, (int,)),
+    "add_etiqueta": (add_etiqueta_cartao, (int,)),
+    "add_anexo": (add_anexo_cartao, (int,)),
+    # seleção de membros/etiquetas no formato antigo (botões de mensagens anteriores ao "v1:")
+    "sm": (selecionar_membro_handler, (int,)),
+    "selecionar_membro": (selecionar_membro_handler, (int,)),
+    "se": (selecionar_etiqueta_handler, (int,)),
+    "selecionar_etiqueta": (selecionar_etiqueta_handler, (int,)),
+    "mover_para_lista": (mover_para_lista_handler, (int, str)),
+    "finalizar_selecao_membros": (finalizar_selecao_membros, ()),
+    "finalizar_selecao_etiquetas": (finalizar_selecao_etiquetas, ()),
+    "finalizar_anexos": (finalizar_anexos_callback, ()),
+    # busca de cartões
+    "editar_cartao_busca": (_via_query(mostrar_opcoes_edicao_cartao_existente), (int,)),
+    "atualizar_cartao_busca": (atualizar_cartao_busca_callback, (int,)),
+    "nova_busca": (nova_busca_callback, ()),
+    "voltar_busca": (voltar_busca_callback, ()),
+    "ver_anexos_existente": (ver_anexos_existente, (int,)),
+    "mover_cartao_existente": (mover_cartao_existente, (int,)),
+    "add_anexo_existente": (add_anexo_existente, (int,)),
+    "add_comentario_existente": (add_comentario_existente, (int,)),
+})
+
+
+# "<prefixo>[_pagina_<n>][|<args>]", ex.: "editar_cartao|3", "busca_pagina_2|termo"
+_CB_RE = re.compile(r"^(?P<p>[a-zA-Z_]+?)(?:_pagina_(?P<page>\d+))?(?:\|(?P<args>.*))?$")
 
-    # Handler para paginação da busca
-    elif data.startswith("busca_pagina_"):
-        try:
-            parts = data.split("|")
-            pagina_info = parts[0]
-            termo_busca = parts[1] if len(parts) > 1 else ""
-            pagina = int(pagina_info.split("_")[2])
-            await handle_busca_paginada(update, context, pagina, termo_busca)
-        except Exception as e:
-            logger.error(f"Erro ao processar paginação: {e}")
-            await query.edit_message_text("❌ Erro ao carregar página.")
-
-    # Handlers para busca de cartões
-    elif data.startswith("editar_cartao_busca|"):
-        index_cartao = int(data.split("|")[1])
-        await mostrar_opcoes_edicao_cartao_existente(query, context, index_cartao)
-
-    elif data == "nova_busca":
-        await query.edit_message_text("🔍 Digite /buscar <termo> para realizar uma nova busca.")
-
-    elif data == "voltar_busca":
-        state = user_states.get(user_id, {})
-        cartoes_encontrados = state.get("cartoes_encontrados", [])
-        termo_busca = state.get("termo_busca", "")
-        if cartoes_encontrados:
-            await mostrar_resultados_busca_from_callback(query, context, cartoes_encontrados, termo_busca)
-        else:
-            await query.edit_message_text("❌ Nenhum resultado de busca encontrado. Use /buscar para uma nova busca.")
 
-    # Novos handlers para ver anexos e mover cartão
-    elif data.startswith("ver_anexos_existente|"):
-        index_cartao = int(data.split("|")[1])
-        await ver_anexos_existente(update, context, index_cartao)
+async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Manipula callbacks dos botões inline"""
+    query = update.callback_query
+    await query.answer()
+
+    data = query.data
 
-    elif data.startswith("mover_cartao_existente|"):
-        index_cartao = int(data.split("|")[1])
-        await mover_cartao_existente(update, context, index_cartao)
+    versao, _, resto = data.partition(":")
+    if versao == CALLBACK_VERSION:
+        prefixo, _, args = resto.partition(":")
+        rota = CALLBACK_ROUTES.get(prefixo)
+        separador = ":"
+    else:
+        m = _CB_RE.match(data)
+        if m is None:
+            return
 
-    elif data.startswith("mover_para_lista|"):
-        parts = data.split("|")
-        index_cartao = int(parts[1])
-        lista_id = parts[2]
-        await mover_para_lista_handler(update, context, index_cartao, lista_id)
+        # Handler para paginação da busca ("busca_pagina_<n>|<termo>")
+        if m["page"] is not None:
+            try:
+                await handle_busca_paginada(update, context, int(m["page"]), m["args"] or "")
+            except Exception as e:
+                logger.error(f"Erro ao processar paginação: {e}")
+                await query.edit_message_text("❌ Erro ao carregar página.")
+            return
 
-    # Novos handlers para adição de anexos e comentários em cartões existentes
-    elif data.startswith("add_anexo_existente|"):
-        index_cartao = int(data.split("|")[1])
-        await add_anexo_existente(update, context, index_cartao)
+        prefixo, args = m["p"], m["args"] or ""
+        rota = CALLBACK_HANDLERS.get(prefixo)
+        separador = "|"
 
-    elif data.startswith("add_comentario_existente|"):
-        index_cartao = int(data.split("|")[1])
-        await add_comentario_existente(update, context, index_cartao)
+    if rota:
+        handler, conversores = rota
+        await handler(update, context, *(conv(a) for conv, a in zip(conversores, args.split(separador))))
 
 
 # -------------------- Funções Auxiliares para Modos Guiados --------------------
@@ -2751,7 +3554,7 @@ def parse_items_from_buffer_lines(lines: List[str]) -> List[str]:
 async def fim_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Finaliza o modo guiado atual"""
     user_id = update.effective_user.id
-    state = user_states.get(user_id, {})
+    state = await state_store.get(user_id)
     mode = state.get("mode")
     if not mode:
         await update.message.reply_text("Nenhum modo ativo.")
@@ -2761,7 +3564,7 @@ async def fim_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     state["mode"] = None
     buffer = state.get("buffer", [])
     state["buffer"] = []
-    user_states[user_id] = state
+    await state_store.set(user_id, state)
 
     await update.message.reply_text(f"Modo {mode} finalizado. Buffer: {len(buffer)} itens.")
 
@@ -2769,28 +3572,100 @@ async def fim_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def handle_anexo_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Manipula documentos enviados no modo anexo normal - QUALQUER TIPO DE ARQUIVO"""
     user_id = update.effective_user.id
-    state = user_states.get(user_id, {})
+    state = await state_store.get(user_id)
     if state.get("mode") != "anexo":
         return
 
     document = update.message.document
     file = await context.bot.get_file(document.file_id)
-    file_path = os.path.join(DOWNLOAD_DIR, f"{user_id}_{document.file_name}")
-    await file.download_to_drive(file_path)
+    file_path = _caminho_anexo(user_id, document.file_name)
+    await baixar_arquivo(file, file_path)
 
     # Armazena o caminho do arquivo
-    anexos = state.get("anexos", [])
+    anexos = state.setdefault("anexos", AnexosPendentes())
     anexos.append(file_path)
-    state["anexos"] = anexos
-    user_states[user_id] = state
+    await state_store.set(user_id, state)
 
     await update.message.reply_text(f"Arquivo '{document.file_name}' recebido. Envie mais ou /fim para subir.")
 
 
+async def persistir_estado(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Roda depois dos demais handlers e grava o estado de quem gerou o update"""
+    if update.effective_user:
+        await state_store.salvar(update.effective_user.id)
+
+
+class ProcessadorPorUsuario(BaseUpdateProcessor):
+    """Trata updates de usuários diferentes em paralelo e os de um mesmo usuário em ordem.
+
+    O estado de cada usuário (modo, anexos, rascunhos) supõe uma mensagem por vez;
+    o lock por usuário mantém isso sem que um usuário segure os demais. A vaga entre
+    as `max_concurrent_updates` só é ocupada depois do lock: a fila de um usuário
+    (ex.: um álbum com muitos arquivos) espera no próprio lock, sem tomar as vagas
+    dos outros.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        # o semáforo da classe base é pego antes do lock do usuário: fica sem limite
+        # prático, e o limite real é aplicado em do_process_update
+        super().__init__(max(max_concurrent_updates, 1 << 30))
+        self._vagas = asyncio.BoundedSemaphore(max_concurrent_updates)
+        # o lock some sozinho quando nenhum update do usuário está usando
+        self._locks = weakref.WeakValueDictionary()
+
+    async def do_process_update(self, update, coroutine):
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is None:
+            async with self._vagas:
+                await coroutine
+            return
+        lock = self._locks.get(user.id)
+        if lock is None:
+            lock = self._locks[user.id] = asyncio.Lock()
+        async with lock, self._vagas:
+            await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
 # -------------------- Main --------------------
 
+_sweeper_task: Optional[asyncio.Task] = None
+
+
+async def post_init(app):
+    global _sweeper_task
+    http_client()
+    rascunho_store.iniciar()
+    _sweeper_task = asyncio.create_task(_expirar_sessoes())
+    # a extração de PDF (pdfplumber) é CPU pura: roda em processos separados
+    pool = app.bot_data["pdf_pool"] = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+    pool.submit(int)  # cria os processos já, enquanto o bot ainda não tem outras threads
+
+
+async def post_shutdown(app):
+    if _sweeper_task:
+        _sweeper_task.cancel()
+    await state_store.encerrar()
+    await rascunho_store.encerrar()
+    await close_http_client()
+    if "pdf_pool" in app.bot_data:
+        app.bot_data.pop("pdf_pool").shutdown(wait=False, cancel_futures=True)
+
+
 def main():    
-    app = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+    app = (
+        ApplicationBuilder()
+        .token(TELEGRAM_TOKEN)
+        .concurrent_updates(ProcessadorPorUsuario(MAX_UPDATES_CONCORRENTES))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     # Comandos básicos
     app.add_handler(CommandHandler("start", start_cmd))
@@ -2818,6 +3693,9 @@ def main():
     # Handler de texto (deve ser o último)
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
 
+    # Grupo 1: executa depois do handler de cada update
+    app.add_handler(TypeHandler(Update, persistir_estado), group=1)
+
     logger.info("Bot iniciado...")
     app.run_polling()
 